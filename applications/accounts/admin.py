@@ -1,9 +1,71 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Q
 
+from applications.accounts.maintenance import update_users
 from applications.accounts.models import User
+from applications.accounts.serializer import linked_providers, role_names, with_profile_relations
+from utils.constants import USER_ROLES
+from utils.helpers import normalize_email
+from utils.paginator import EstimatedCountPaginator
 
 
-admin.site.register(User)
+def change_role_action(role, label):
+    def change_role(modeladmin, request, queryset):
+        updated = update_users(queryset, role=role)
+        modeladmin.message_user(request, '%d users changed to %s.' % (updated, label), messages.SUCCESS)
+    change_role.__name__ = str('change_role_to_%s' % role)
+    change_role.short_description = 'Change role of selected users to %s' % label
+    return change_role
+
+
+class UserAdmin(admin.ModelAdmin):
+    """
+    Admin of the user table, usable at millions of rows: estimated counts,
+    prefetched relations, index-backed prefix search and set-based actions.
+    """
+
+    list_display = ('id', 'email', 'first_name', 'last_name', 'role', 'is_active', 'role_list', 'providers')
+    list_filter = ('is_active', 'is_staff', 'role')
+    # Only shows the search box, `get_search_results` does the lookups.
+    search_fields = ('email', 'first_name', 'last_name')
+    raw_id_fields = ('roles', 'groups')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['deactivate_users'] + [change_role_action(role, label) for role, label in USER_ROLES]
+
+    def get_queryset(self, request):
+        return with_profile_relations(super(UserAdmin, self).get_queryset(request))
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Prefix search: emails through the unique `email_normalized` index, names
+        through the prefix indexes, matching the term as typed and capitalized.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if '@' in term:
+            return queryset.filter(email_normalized__startswith=normalize_email(term)), False
+        lookups = Q(email_normalized__startswith=normalize_email(term))
+        for prefix in set([term, term.capitalize()]):
+            lookups |= Q(first_name__startswith=prefix) | Q(last_name__startswith=prefix)
+        return queryset.filter(lookups), False
+
+    def role_list(self, obj):
+        return ', '.join(role_names(obj))
+    role_list.short_description = 'Roles'
+
+    def providers(self, obj):
+        return ', '.join(sorted(linked_providers(obj)))
+    providers.short_description = 'Social Accounts'
+
+    def deactivate_users(self, request, queryset):
+        updated = update_users(queryset, is_active=False)
+        self.message_user(request, '%d users deactivated.' % updated, messages.SUCCESS)
+    deactivate_users.short_description = 'Deactivate selected users'
+
+
+admin.site.register(User, UserAdmin)
@@ -0,0 +1,11 @@
+# coding=utf-8
+
+from django.apps import AppConfig
+
+
+class AccountsConfig(AppConfig):
+    name = 'applications.accounts'
+    verbose_name = 'Accounts'
+
+    def ready(self):
+        from applications.accounts import signals  # noqa: connects the signal receivers
@@ -2,7 +2,8 @@
 
 from django.contrib.auth import get_user_model
 
-from utils.helpers import ValidateFBAccessToken
+from applications.accounts.user_cache import get_cached_user
+from utils.helpers import ValidateFBAccessToken, normalize_email
 
 User = get_user_model()
 
@@ -18,21 +19,17 @@ class EmailAuthBackend(object):
     def authenticate(self, username=None, password=None):
         """ Authenticate a user based on email address as the user name. """
         try:
-            user = User.objects.get(email=username)
-            if user:
-                if user.check_password(password):
-                    return user
-        except User.DoesNotExist:
-            return None
-        except User.MultipleObjectsReturned:
-            user = User.objects.get(email=username)[0]
+            # `email_normalized` is unique and indexed, duplicates are merged by `merge_duplicate_users`.
+            user = User.objects.get(email_normalized=normalize_email(username))
             if user.check_password(password):
                 return user
+        except User.DoesNotExist:
+            return None
 
     def get_user(self, user_id):
         """ Get a User object from the user_id. """
         try:
-            return User.objects.get(pk=user_id)
+            return get_cached_user(user_id)
         except User.DoesNotExist:
             return None
 
@@ -0,0 +1,177 @@
+# coding=utf-8
+
+"""
+In-process Bloom filter of registered emails.
+
+Email existence checks first ask the filter: a definite negative skips the
+database, a possible positive is confirmed with an `exists()` query. The
+filter is built in the background when the web process starts (`warm`),
+checks go to the database until it is ready. It is updated by user
+post_save, and every `EMAIL_BLOOM_SYNC_INTERVAL` seconds it pulls the
+users other workers created (by primary key) or changed the email of (by
+`email_changed_at`). Replaced emails are never removed from the filter,
+they only add false positives until the next rebuild.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from utils.bloom import BloomFilter
+from utils.helpers import normalize_email
+
+EMAIL_BLOOM_ERROR_RATE = getattr(settings, 'EMAIL_BLOOM_ERROR_RATE', 0.01)
+EMAIL_BLOOM_MIN_CAPACITY = getattr(settings, 'EMAIL_BLOOM_MIN_CAPACITY', 100000)
+EMAIL_BLOOM_SYNC_INTERVAL = getattr(settings, 'EMAIL_BLOOM_SYNC_INTERVAL', 1)
+# Full rebuilds drop emails that were changed, they also happen when the filter outgrows its capacity.
+EMAIL_BLOOM_REBUILD_INTERVAL = getattr(settings, 'EMAIL_BLOOM_REBUILD_INTERVAL', 3600)
+
+# Ids and timestamps are not always committed in order, each sync re-reads this many ids below the
+# high-water mark and the emails changed this many seconds before the previous sync.
+EMAIL_BLOOM_SYNC_LOOKBACK = 100
+EMAIL_BLOOM_SYNC_LOOKBACK_SECONDS = 30
+
+# Bumped by `manage.py rebuild_email_bloom` to make every worker rebuild its filter.
+EPOCH_CACHE_KEY = 'email-bloom-epoch'
+
+logger = logging.getLogger(__name__)
+
+
+class EmailIndex(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bloom = None
+        self.high_water = 0
+        self.changed_since = None
+        # Pid of the process warming the filter, threads do not survive a fork into workers.
+        self.warming = None
+        self.epoch = None
+        self.built_at = 0
+        self.synced_at = 0
+        self.stats = {'checks': 0, 'definite_negatives': 0, 'db_checks': 0, 'false_positives': 0, 'rebuilds': 0}
+
+    def build(self):
+        """ Builds a new filter from every registered email, streamed from the database. """
+        User = get_user_model()
+        started = timezone.now()
+        high_water = User.objects.aggregate(id=Max('id'))['id'] or 0
+        bloom = BloomFilter(max(User.objects.count() * 2, EMAIL_BLOOM_MIN_CAPACITY), EMAIL_BLOOM_ERROR_RATE)
+        for email in User.objects.filter(id__lte=high_water).values_list('email', flat=True).iterator():
+            if email:
+                bloom.add(normalize_email(email))
+        with self._lock:
+            self.bloom, self.high_water, self.changed_since = bloom, high_water, started
+            self.built_at = self.synced_at = time.time()
+            self.stats['rebuilds'] += 1
+        return bloom
+
+    def sync(self):
+        """ Adds users created, or whose email changed, since the last sync, possibly by other processes. """
+        User = get_user_model()
+        started = timezone.now()
+        changed_since = self.changed_since - timedelta(seconds=EMAIL_BLOOM_SYNC_LOOKBACK_SECONDS)
+        rows = list(User.objects.filter(Q(id__gt=self.high_water - EMAIL_BLOOM_SYNC_LOOKBACK) |
+                                        Q(email_changed_at__gte=changed_since)).values_list('id', 'email'))
+        with self._lock:
+            for user_id, email in rows:
+                if email:
+                    self.bloom.add(normalize_email(email))
+                self.high_water = max(self.high_water, user_id)
+            self.changed_since = started
+            self.synced_at = time.time()
+
+    def warm(self):
+        """ Builds the filter in a background thread, so no request waits for the full email scan. """
+        self.warming = os.getpid()
+        thread = threading.Thread(target=self._warm, name='email-bloom-warm')
+        thread.daemon = True
+        thread.start()
+
+    def _warm(self):
+        try:
+            epoch = cache.get(EPOCH_CACHE_KEY)
+            self.build()
+            self.epoch = epoch
+        except Exception:
+            logger.exception('Email Bloom filter warm-up failed, it is built by the next check.')
+        finally:
+            self.warming = None
+            # The thread's own connection is never closed by the request cycle.
+            connection.close()
+
+    def ensure_fresh(self):
+        """ Returns whether the filter can answer checks, building or syncing it when due. """
+        now = time.time()
+        if self.bloom is None and self.warming == os.getpid():
+            return False
+        if self.bloom is not None and now - self.synced_at < EMAIL_BLOOM_SYNC_INTERVAL:
+            return True
+        epoch = cache.get(EPOCH_CACHE_KEY)
+        if (self.bloom is None or epoch != self.epoch or now - self.built_at > EMAIL_BLOOM_REBUILD_INTERVAL
+                or self.bloom.count > self.bloom.capacity):
+            self.build()
+            self.epoch = epoch
+        else:
+            self.sync()
+        return True
+
+    def add(self, email):
+        if self.bloom is not None and email:
+            with self._lock:
+                self.bloom.add(normalize_email(email))
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def exists(self, email, queryset=None):
+        """
+        Returns whether a user with this email exists.
+        `queryset` overrides the query confirming possible positives.
+        """
+        fresh = self.ensure_fresh()
+        self._count('checks')
+        if fresh and normalize_email(email) not in self.bloom:
+            self._count('definite_negatives')
+            return False
+        self._count('db_checks')
+        if queryset is None:
+            queryset = get_user_model().objects.filter(email_normalized=normalize_email(email))
+        found = queryset.exists()
+        if fresh and not found:
+            self._count('false_positives')
+        return found
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        negatives = stats['definite_negatives'] + stats['false_positives']
+        stats['observed_false_positive_rate'] = \
+            round(stats['false_positives'] / float(negatives), 6) if negatives else None
+        if self.bloom is not None:
+            stats.update({
+                'size': self.bloom.count,
+                'capacity': self.bloom.capacity,
+                'bits': self.bloom.num_bits,
+                'hashes': self.bloom.num_hashes,
+                'estimated_false_positive_rate': round(self.bloom.estimated_false_positive_rate(), 6),
+            })
+        return stats
+
+
+email_index = EmailIndex()
+
+
+def request_rebuild():
+    """ Makes every worker sharing the default cache rebuild its filter at its next sync. """
+    cache.set(EPOCH_CACHE_KEY, time.time(), None)
@@ -0,0 +1,80 @@
+# coding=utf-8
+
+"""
+Streaming export and keyset pagination of users.
+
+Users are read in batches of ascending id (`id > last id`), never with
+OFFSET, so every batch costs the same whatever its position and an export
+holds one batch in memory at a time.
+"""
+
+import csv
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+from django.utils.encoding import force_bytes
+
+from applications.accounts.fast_serializer import attach_relations
+
+USER_EXPORT_BATCH_SIZE = getattr(settings, 'USER_EXPORT_BATCH_SIZE', 2000)
+USER_LIST_MAX_LIMIT = getattr(settings, 'USER_LIST_MAX_LIMIT', 500)
+
+EXPORT_FIELDS = ('id', 'email', 'first_name', 'last_name', 'mobile', 'gender', 'role', 'dob', 'is_active',
+                 'is_staff', 'date_joined', 'last_login')
+EXPORT_COLUMNS = EXPORT_FIELDS + ('providers', 'roles')
+
+
+def keyset_page(queryset, after=0, limit=100):
+    """
+    Returns the users (or `values()` rows) of `queryset` with an id above
+    `after`, at most `limit`, and the cursor of the next page or None.
+    """
+    items = list(queryset.filter(id__gt=after).order_by('id')[:limit + 1])
+    if len(items) <= limit:
+        return items, None
+    last = items[limit - 1]
+    return items[:limit], last['id'] if isinstance(last, dict) else last.id
+
+
+def iter_export_rows(queryset=None, after=0, batch_size=USER_EXPORT_BATCH_SIZE):
+    """ Yields an OrderedDict of `EXPORT_COLUMNS` per user, in id order. """
+    queryset = get_user_model().objects.all() if queryset is None else queryset
+    while True:
+        rows = attach_relations(list(queryset.filter(id__gt=after).order_by('id')
+                                     .values(*EXPORT_FIELDS)[:batch_size]))
+        if not rows:
+            return
+        for row in rows:
+            row['providers'] = sorted(row.pop('oauth_providers'))
+            row['roles'] = row.pop('role_names')
+            yield OrderedDict((column, row[column]) for column in EXPORT_COLUMNS)
+        after = rows[-1]['id']
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo(object):
+    """ File-like object returning what is written, so `csv.writer` can produce one line at a time. """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+
+    def line(values):
+        # The Python 2 csv module only writes byte strings.
+        return writer.writerow([force_bytes(value) for value in values] if six.PY2 else values)
+
+    yield line(EXPORT_COLUMNS)
+    for row in rows:
+        values = [';'.join(value) if isinstance(value, list) else value for value in row.values()]
+        yield line(['' if value is None else value for value in values])
@@ -0,0 +1,175 @@
+# coding=utf-8
+
+"""
+Compiled representation of the profile serializers.
+
+`compile_serializer` turns the bound fields of a profile serializer into one
+generated function returning the same OrderedDict as `to_representation`,
+without DRF's per-field dispatch. Plain model fields and the known getters
+of the profile serializers are inlined, any other field is represented by
+the DRF field itself, so the output is always identical to the serializer's.
+
+Compiled functions read model instances, or `values()` rows from
+`profile_rows` when compiled with `rows=True`.
+"""
+
+import threading
+from collections import OrderedDict, defaultdict
+from functools import partial
+
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import six
+from rest_framework import fields as drf_fields
+from rest_framework.fields import SkipField
+
+from applications.accounts.generator import LOOKUP_BATCH_SIZE
+from applications.accounts.serializer import OAUTH_PROVIDERS, linked_providers, role_names
+from utils.instrumentation import timed
+
+FAST_PROFILE_SERIALIZER = getattr(settings, 'FAST_PROFILE_SERIALIZER', False)
+
+# Expressions of the `SerializerMethodField` getters shared by the profile serializers,
+# `{attr}` is replaced by the access to a model attribute of `obj`.
+INLINE_GETTERS = {
+    'get_fname': "'%s' % ({first_name},)",
+    'get_lname': "'%s' % ({last_name},)",
+    'get_phone': "('%s' % ({mobile},)) if {mobile} else ''",
+    'get_address': '""',
+    'get_dob': "{dob}.strftime('%d/%m/%Y') if {dob} else \"\"",
+    'get_image_url': "{profile_image_url} if {profile_image_url} else ''",
+    'get_oauth': "{{'facebook': 'facebook' in providers, 'google': 'google' in providers}}",
+    'get_roles': 'roles',
+}
+
+# Values computed once per object by getters needing relations: instance and row expressions.
+GETTER_PRELUDES = {
+    'get_oauth': ('providers = linked_providers(obj)', "providers = obj['oauth_providers']"),
+    'get_roles': ('roles = role_names(obj)', "roles = obj['role_names']"),
+}
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def _represent_field(ret, field, obj):
+    """ What `Serializer.to_representation` does for one field. """
+    try:
+        attribute = field.get_attribute(obj)
+    except SkipField:
+        return
+    ret[field.field_name] = None if attribute is None else field.to_representation(attribute)
+
+
+def _inline_getter(serializer, field):
+    """ Returns whether a method field uses a getter of `INLINE_GETTERS`, not an override of a subclass. """
+    method_name = getattr(field, 'method_name', None)
+    return (isinstance(field, drf_fields.SerializerMethodField) and method_name in INLINE_GETTERS and
+            getattr(type(serializer), method_name).__module__ == 'applications.accounts.serializer')
+
+
+def _plain_field(field, to_representation):
+    return type(field).to_representation == to_representation and len(field.source_attrs) == 1
+
+
+def generate_source(serializer, rows=False):
+    """
+    Returns the source of the compiled `represent(obj, fields)` function of
+    a serializer, `fields` being the serializer's `_readable_fields` list.
+    """
+    access = (lambda name: 'obj[%r]' % name) if rows else (lambda name: 'obj.%s' % name)
+    attrs = dict((f.attname, access(f.attname)) for f in get_user_model()._meta.concrete_fields)
+
+    prelude, body = [], []
+    for index, field in enumerate(serializer._readable_fields):
+        name = field.field_name
+        method_name = getattr(field, 'method_name', None)
+        if _inline_getter(serializer, field):
+            if method_name in GETTER_PRELUDES:
+                prelude.append(GETTER_PRELUDES[method_name][rows])
+            body.append('ret[%r] = %s' % (name, INLINE_GETTERS[method_name].format(**attrs)))
+        elif _plain_field(field, drf_fields.CharField.to_representation) and field.source in attrs:
+            body.append('value = %s' % attrs[field.source])
+            body.append('ret[%r] = None if value is None else text_type(value)' % name)
+        elif _plain_field(field, drf_fields.IntegerField.to_representation) and field.source in attrs:
+            body.append('value = %s' % attrs[field.source])
+            body.append('ret[%r] = None if value is None else int(value)' % name)
+        else:
+            body.append('represent_field(ret, fields[%d], obj)' % index)
+
+    lines = ['def represent(obj, fields):'] + ['    ' + line for line in prelude]
+    lines += ['    ret = OrderedDict()'] + ['    ' + line for line in body] + ['    return ret']
+    return '\n'.join(lines) + '\n'
+
+
+def compiled_function(serializer, rows=False):
+    """
+    Returns the compiled `represent(obj, fields)` function of a profile
+    serializer instance, for its selected fields. Functions are compiled
+    once per serializer class, field selection and input kind, and hold no
+    reference to the serializer, its bound fields or their context.
+    """
+    key = (type(serializer), tuple(serializer.fields), rows)
+    represent = _compiled.get(key)
+    if represent is None:
+        namespace = {
+            'OrderedDict': OrderedDict,
+            'text_type': six.text_type,
+            'linked_providers': linked_providers,
+            'role_names': role_names,
+            'represent_field': _represent_field,
+        }
+        code = compile(generate_source(serializer, rows), '<compiled %s>' % type(serializer).__name__, 'exec')
+        exec(code, namespace)
+        represent = namespace['represent']
+        with _compiled_lock:
+            _compiled[key] = represent
+    return represent
+
+
+def compile_serializer(serializer, rows=False):
+    """
+    Returns `represent(obj)` for a profile serializer instance: its compiled
+    function bound to the serializer's own fields, so fields left to DRF use
+    this serializer's context and request.
+    """
+    return partial(compiled_function(serializer, rows), fields=list(serializer._readable_fields))
+
+
+def represent_profile(serializer, instance):
+    """ Returns `serializer.to_representation(instance)`, compiled when `FAST_PROFILE_SERIALIZER` is on. """
+    if FAST_PROFILE_SERIALIZER:
+        represent = compile_serializer(serializer)
+        with timed('serializer'):
+            return represent(instance)
+    serializer.instance = instance
+    return OrderedDict(serializer.data)
+
+
+def attach_relations(rows, fields=('oauth', 'roles')):
+    """
+    Adds the `oauth_providers` set and `role_names` list of every user row,
+    read in one query per relation and batch of users.
+    """
+    ids = [row['id'] for row in rows]
+    providers, roles = defaultdict(set), defaultdict(list)
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[start:start + LOOKUP_BATCH_SIZE]
+        if 'oauth' in fields:
+            for user_id, provider in SocialAccount.objects.filter(
+                    user_id__in=batch, provider__in=OAUTH_PROVIDERS).values_list('user_id', 'provider'):
+                providers[user_id].add(provider)
+        if 'roles' in fields:
+            for user_id, name in get_user_model().roles.through.objects.filter(
+                    user_id__in=batch).values_list('user_id', 'userroles__name'):
+                roles[user_id].append(name)
+    for row in rows:
+        row['oauth_providers'] = providers[row['id']]
+        row['role_names'] = roles[row['id']]
+    return rows
+
+
+def profile_rows(queryset, fields=('oauth', 'roles')):
+    """ Returns `values()` rows of users for serializers compiled with `rows=True`. """
+    return attach_relations(list(queryset.values()), fields)
@@ -0,0 +1,158 @@
+# coding=utf-8
+
+"""
+Bulk synthetic data generation for benchmarks and capacity tests.
+
+Rows are produced in chunks, each chunk seeded from the run seed and its
+own index, so the generated data is identical whatever the number of
+worker processes. Facebook accounts of user n use the uid and access token
+of fake Graph fixture user n (see `utils.fake_graph`).
+"""
+
+import datetime
+import multiprocessing
+
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sites.models import Site
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils.six.moves import range
+
+from applications.accounts.models import UserRoles
+from utils.constants import USER_ROLES
+from utils.fake_graph import FIXTURE_UID_BASE, fixture_token, fixture_user
+from utils.helpers import UtlRandom
+
+User = get_user_model()
+
+DEFAULT_PASSWORD = 'password'
+DOB_START = datetime.date(1950, 1, 1)
+# Keeps IN clauses under SQLite's default limit of 999 bound parameters.
+LOOKUP_BATCH_SIZE = 900
+
+
+def ensure_social_app(provider, name):
+    app, created = SocialApp.objects.get_or_create(provider=provider, defaults={
+        'name': name, 'client_id': '%s-client-id' % provider, 'secret': '%s-secret' % provider})
+    if created:
+        app.sites.add(Site.objects.get_current())
+    return app
+
+
+def ensure_roles():
+    """ Returns a `{role name: UserRoles id}` dict, creating the roles of `USER_ROLES` if needed. """
+    roles = dict(UserRoles.objects.values_list('name', 'id'))
+    missing = [UserRoles(name=name) for name, label in USER_ROLES if name not in roles]
+    if missing:
+        UserRoles.objects.bulk_create(missing)
+        roles = dict(UserRoles.objects.values_list('name', 'id'))
+    return roles
+
+
+def next_user_number():
+    """ Returns the first user number not generated yet, so runs can be resumed. """
+    # Generated uids all have the same number of digits, so their string maximum is the numeric one.
+    uid = SocialAccount.objects.filter(provider='facebook', uid__regex=r'^1[0-9]{14}$') \
+        .aggregate(uid=Max('uid'))['uid']
+    return int(uid) - FIXTURE_UID_BASE + 1 if uid else 0
+
+
+def lookup_ids(queryset, field, values):
+    """ Returns a `{field value: id}` dict for rows of `queryset` whose `field` is in `values`. """
+    ids = {}
+    for index in range(0, len(values), LOOKUP_BATCH_SIZE):
+        lookup = {'%s__in' % field: values[index:index + LOOKUP_BATCH_SIZE]}
+        ids.update(queryset.filter(**lookup).values_list(field, 'id'))
+    return ids
+
+
+def build_users(start, stop, rnd, password_hash):
+    users = []
+    for n in range(start, stop):
+        data = fixture_user(n)
+        email = '%s.%d@example.com' % (rnd.random_username(8), n)
+        users.append(User(username=email, email=email, email_normalized=email, password=password_hash,
+                          first_name=rnd.random_username(6).capitalize(),
+                          last_name=rnd.random_username(8).capitalize(),
+                          mobile='9' + rnd.random_digits(9), gender=data['gender'],
+                          role=USER_ROLES[rnd.random_num(0, len(USER_ROLES) - 1)][0],
+                          dob=DOB_START + datetime.timedelta(days=rnd.random_num(0, 20000))))
+    return users
+
+
+def generate_chunk(start, stop, seed, password_hash, role_ids, facebook_app_id, google_ratio):
+    """
+    Creates users `start..stop-1` with their role membership, a Facebook
+    SocialAccount plus SocialToken each, and a Google SocialAccount for a
+    `google_ratio` share of them. Returns the number of users created.
+    """
+    rnd = UtlRandom(seed=seed * 1000003 + start)
+    users = build_users(start, stop, rnd, password_hash)
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # bulk_create does not return primary keys on every backend, read them back by username.
+        ids = lookup_ids(User.objects.all(), 'username', [user.username for user in users])
+
+        memberships = [User.roles.through(user_id=ids[user.username], userroles_id=role_ids[user.role])
+                       for user in users if user.role in role_ids]
+        User.roles.through.objects.bulk_create(memberships)
+
+        accounts = []
+        for n, user in zip(range(start, stop), users):
+            data = fixture_user(n)
+            accounts.append(SocialAccount(user_id=ids[user.username], provider='facebook', uid=data['id'],
+                                          extra_data=data))
+            if rnd.random.random() < google_ratio:
+                accounts.append(SocialAccount(user_id=ids[user.username], provider='google',
+                                              uid=str(FIXTURE_UID_BASE * 10 + n),
+                                              extra_data={'email': user.email}))
+        SocialAccount.objects.bulk_create(accounts)
+
+        account_ids = lookup_ids(SocialAccount.objects.filter(provider='facebook'), 'uid',
+                                 [account.uid for account in accounts if account.provider == 'facebook'])
+        SocialToken.objects.bulk_create([SocialToken(app_id=facebook_app_id, account_id=account_ids[uid],
+                                                     token=fixture_token(int(uid) - FIXTURE_UID_BASE))
+                                         for uid in account_ids])
+    return len(users)
+
+
+def _generate_chunk(args):
+    return generate_chunk(*args)
+
+
+def generate_users(count, start=None, chunk_size=5000, workers=1, seed=0, password=DEFAULT_PASSWORD,
+                   google_ratio=0.3, progress=None):
+    """
+    Generates `count` users starting at user number `start` (by default right
+    after the last generated user) and returns the number created.
+    `progress(created, count)` is called after every chunk.
+    """
+    start = next_user_number() if start is None else start
+    # Hashing once keeps PBKDF2 out of the loop, every generated user shares the password.
+    password_hash = make_password(password)
+    role_ids = ensure_roles()
+    facebook_app_id = ensure_social_app('facebook', 'Facebook').id
+    chunks = [(first, min(first + chunk_size, start + count), seed, password_hash, role_ids, facebook_app_id,
+               google_ratio) for first in range(start, start + count, chunk_size)]
+
+    created = 0
+    if workers > 1:
+        # Forked workers must open their own connections instead of sharing the parent's socket.
+        connections.close_all()
+        pool = multiprocessing.Pool(workers)
+        try:
+            for size in pool.imap_unordered(_generate_chunk, chunks):
+                created += size
+                if progress:
+                    progress(created, count)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunks:
+            created += generate_chunk(*chunk)
+            if progress:
+                progress(created, count)
+    return created
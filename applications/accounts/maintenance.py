@@ -0,0 +1,121 @@
+# coding=utf-8
+
+"""
+Chunked maintenance jobs for the user table: `email_normalized` backfill,
+merging of duplicate accounts and bulk updates. Every chunk runs in its own
+transaction, so an interrupted run resumes where it stopped.
+"""
+
+from allauth.account.models import EmailAddress
+from allauth.socialaccount.models import SocialAccount
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+
+from applications.accounts.models import FacebookPagePost, User
+from applications.accounts.profile_cache import bump_profile_version, bump_profile_versions
+from utils.helpers import normalize_email
+
+# Small enough for SQLite's limit of 999 bound parameters per query.
+CHUNK_SIZE = 400
+
+
+def backfill_email_normalized(user_model=User, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Fills `email_normalized` of users missing it. Within a group of duplicate
+    emails only the oldest user gets the value, the others stay NULL until
+    `merge_duplicates` merges them. Returns the number of updated users.
+    """
+    last_id, updated = 0, 0
+    while True:
+        rows = list(user_model.objects.filter(id__gt=last_id, email_normalized__isnull=True).exclude(email='')
+                    .order_by('id').values_list('id', 'email')[:chunk_size])
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+
+        oldest = {}
+        for user_id, email in rows:
+            oldest.setdefault(normalize_email(email), user_id)
+        taken = set(user_model.objects.filter(email_normalized__in=list(oldest))
+                    .values_list('email_normalized', flat=True))
+        updates = dict((user_id, email) for email, user_id in oldest.items() if email not in taken)
+        if updates:
+            with transaction.atomic():
+                user_model.objects.filter(id__in=list(updates)).update(email_normalized=Case(
+                    *[When(id=user_id, then=Value(email)) for user_id, email in updates.items()],
+                    output_field=models.CharField()))
+            updated += len(updates)
+        if progress:
+            progress(last_id, updated)
+
+
+def merge_user(duplicate, primary, delete=True):
+    """
+    Moves the social accounts, email addresses, roles and page posts of
+    `duplicate` to `primary`, then deletes `duplicate` (or deactivates it
+    and clears its email when `delete` is False).
+    """
+    SocialAccount.objects.filter(user=duplicate).update(user=primary)
+    primary_emails = set(normalize_email(email) for email in
+                         EmailAddress.objects.filter(user=primary).values_list('email', flat=True))
+    for address in EmailAddress.objects.filter(user=duplicate):
+        if normalize_email(address.email) in primary_emails:
+            address.delete()
+        else:
+            EmailAddress.objects.filter(pk=address.pk).update(user=primary, primary=False)
+    primary.roles.add(*duplicate.roles.all())
+    FacebookPagePost.objects.filter(user=duplicate).update(user=primary)
+    if delete:
+        duplicate.delete()
+    else:
+        User.objects.filter(pk=duplicate.pk).update(is_active=False, email='', email_normalized=None)
+        # `update` sends no post_save, the cached user object of the duplicate must go explicitly.
+        bump_profile_version(duplicate.pk)
+
+
+def merge_duplicates(batch_size=100, delete=True, dry_run=False, progress=None):
+    """
+    Merges every user left without `email_normalized` because an older
+    account owns the same email. Returns a list of `(duplicate id, primary id)`.
+    """
+    merged, last_id = [], 0
+    while True:
+        duplicates = list(User.objects.filter(id__gt=last_id, email_normalized__isnull=True).exclude(email='')
+                          .order_by('id')[:batch_size])
+        if not duplicates:
+            return merged
+        last_id = duplicates[-1].id
+        primaries = dict((user.email_normalized, user) for user in User.objects.filter(
+            email_normalized__in=set(normalize_email(user.email) for user in duplicates)))
+
+        with transaction.atomic():
+            for duplicate in duplicates:
+                primary = primaries.get(normalize_email(duplicate.email))
+                if primary is None:
+                    # The owner of the email is gone, the duplicate becomes the owner.
+                    if not dry_run:
+                        duplicate.save(update_fields=['email'])
+                    primaries[normalize_email(duplicate.email)] = duplicate
+                    continue
+                if not dry_run:
+                    merge_user(duplicate, primary, delete=delete)
+                merged.append((duplicate.id, primary.id))
+        if progress:
+            progress(last_id, len(merged))
+
+
+def update_users(queryset, chunk_size=CHUNK_SIZE, **values):
+    """
+    Sets `values` on every user of `queryset` with one UPDATE per chunk of
+    ids, walked in id order. Returns the number of updated users.
+    """
+    last_id, updated = 0, 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return updated
+        last_id = ids[-1]
+        with transaction.atomic():
+            updated += User.objects.filter(id__in=ids).update(**values)
+            # `update` sends no post_save, cached users and profiles must go explicitly.
+            bump_profile_versions(ids)
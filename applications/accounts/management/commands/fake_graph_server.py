@@ -0,0 +1,50 @@
+# coding=utf-8
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from utils.fake_graph import FakeGraphAPI, FakeGraphServer
+
+
+class Command(BaseCommand):
+    help = ('Runs a local stand-in for the Facebook Graph API. '
+            'Fixture user n answers to the access token "fake-token-<n>".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--users', type=int, default=100000,
+                            help='Number of seeded fixture users.')
+        parser.add_argument('--fixture', default=None,
+                            help='JSON file with extra users: a list of /me payloads carrying an "access_token".')
+        parser.add_argument('--latency', default=None,
+                            help='Latency distribution in ms, e.g. fixed:50, uniform:20,80, normal:60,15, '
+                                 'lognormal:4,0.5.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of calls answered with a transient 500 error.')
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help='Calls allowed per rate window before "(#4) Application request limit reached".')
+        parser.add_argument('--rate-window', type=int, default=60, help='Rate limit window in seconds.')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--verbose-requests', action='store_true', help='Log every request.')
+
+    def handle(self, *args, **options):
+        users = {}
+        if options['fixture']:
+            with open(options['fixture']) as fixture:
+                for user in json.load(fixture):
+                    users[user.pop('access_token')] = user
+
+        app = FakeGraphAPI(users=users, fixture_users=options['users'], latency=options['latency'],
+                           error_rate=options['error_rate'], rate_limit=options['rate_limit'],
+                           rate_window=options['rate_window'], seed=options['seed'])
+        server = FakeGraphServer(app, host=options['host'], port=options['port'],
+                                 quiet=not options['verbose_requests'])
+        self.stdout.write('Fake Graph API listening on %s (set FB_GRAPH_API_URL to use it)' % server.url)
+        try:
+            server.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server.server_close()
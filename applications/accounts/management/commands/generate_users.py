@@ -0,0 +1,35 @@
+# coding=utf-8
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.accounts.generator import DEFAULT_PASSWORD, generate_users
+
+
+class Command(BaseCommand):
+    help = ('Generates synthetic users with role memberships, SocialAccounts and SocialTokens. '
+            'Facebook account n answers to the fake Graph token "fake-token-<n>".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of users to generate.')
+        parser.add_argument('--start', type=int, default=None,
+                            help='First user number (default: resume after the last generated user).')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk_create.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes (use with PostgreSQL, SQLite serializes writers).')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random data.')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password of every generated user.')
+        parser.add_argument('--google-ratio', type=float, default=0.3,
+                            help='Share of users that also get a Google SocialAccount.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+
+        def progress(created, count):
+            self.stdout.write('%d/%d users (%.0f users/s)' % (created, count, created / (time.time() - started)))
+
+        created = generate_users(options['count'], start=options['start'], chunk_size=options['chunk_size'],
+                                 workers=options['workers'], seed=options['seed'], password=options['password'],
+                                 google_ratio=options['google_ratio'], progress=progress)
+        self.stdout.write('Generated %d users in %.1fs' % (created, time.time() - started))
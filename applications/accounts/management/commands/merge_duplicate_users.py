@@ -0,0 +1,32 @@
+# coding=utf-8
+
+from django.core.management.base import BaseCommand
+
+from applications.accounts.maintenance import CHUNK_SIZE, backfill_email_normalized, merge_duplicates
+
+
+class Command(BaseCommand):
+    help = ('Backfills User.email_normalized in resumable chunks, then merges users sharing an email '
+            '(case-insensitively) into the oldest account, moving their SocialAccounts, email addresses, '
+            'roles and page posts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Users per backfill chunk.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Duplicates merged per transaction.')
+        parser.add_argument('--deactivate', action='store_true',
+                            help='Deactivate merged duplicates and clear their email instead of deleting them.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicates to merge.')
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            updated = backfill_email_normalized(
+                chunk_size=options['chunk_size'],
+                progress=lambda last_id, count: self.stdout.write('backfilled %d users (id <= %d)' % (count, last_id)))
+            self.stdout.write('Backfilled email_normalized of %d users' % updated)
+
+        merged = merge_duplicates(batch_size=options['batch_size'], delete=not options['deactivate'],
+                                  dry_run=options['dry_run'])
+        for duplicate_id, primary_id in merged:
+            self.stdout.write('%s user %d into %d' % ('would merge' if options['dry_run'] else 'merged',
+                                                      duplicate_id, primary_id))
+        self.stdout.write('%d duplicate users %s' % (len(merged), 'found' if options['dry_run'] else 'merged'))
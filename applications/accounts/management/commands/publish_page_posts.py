@@ -0,0 +1,31 @@
+# coding=utf-8
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.accounts.outbox import GRAPH_BATCH_LIMIT, PAGE_POST_MAX_ATTEMPTS, publish_page_posts
+
+
+class Command(BaseCommand):
+    help = 'Publishes queued Facebook page posts in Graph batch requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=GRAPH_BATCH_LIMIT,
+                            help='Posts per Graph batch request (max %d).' % GRAPH_BATCH_LIMIT)
+        parser.add_argument('--max-attempts', type=int, default=PAGE_POST_MAX_ATTEMPTS,
+                            help='Attempts before a post is marked as failed.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep draining the outbox instead of exiting once it is empty.')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep when the outbox is empty in --loop mode.')
+
+    def handle(self, *args, **options):
+        while True:
+            result = publish_page_posts(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            if any(result.values()):
+                self.stdout.write('sent=%(sent)d retried=%(retried)d failed=%(failed)d' % result)
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
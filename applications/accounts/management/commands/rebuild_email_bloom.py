@@ -0,0 +1,27 @@
+# coding=utf-8
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.accounts.email_index import EmailIndex, request_rebuild
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the registered-email Bloom filter, prints its size and false positive rate, '
+            'and makes every web worker sharing the default cache rebuild its own filter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-broadcast', action='store_true',
+                            help='Only build and report, do not ask the workers to rebuild.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        index = EmailIndex()
+        index.build()
+        metrics = index.metrics()
+        metrics['build_seconds'] = round(time.time() - started, 3)
+        if not options['no_broadcast']:
+            request_rebuild()
+        self.stdout.write(json.dumps(metrics, indent=2, sort_keys=True))
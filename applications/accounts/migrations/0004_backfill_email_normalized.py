@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def backfill_email_normalized(apps, schema_editor):
+    """
+    Django 1.9 runs a migration in a single transaction. On large tables run
+    `manage.py migrate accounts 0003` then `manage.py merge_duplicate_users`,
+    which backfills in committed, resumable chunks, before migrating further:
+    this step then finds nothing left to do.
+    """
+    from applications.accounts.maintenance import backfill_email_normalized as backfill
+    backfill(user_model=apps.get_model('accounts', 'User'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_email_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_email_normalized, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+NAME_COLUMNS = ('first_name', 'last_name')
+
+
+def index_name(column):
+    return 'accounts_user_%s_prefix' % column
+
+
+def create_name_indexes(apps, schema_editor):
+    # Prefix LIKE lookups only use PostgreSQL indexes built with a pattern operator class.
+    opclass = ' varchar_pattern_ops' if schema_editor.connection.vendor == 'postgresql' else ''
+    table = schema_editor.quote_name(apps.get_model('accounts', 'User')._meta.db_table)
+    for column in NAME_COLUMNS:
+        schema_editor.execute('CREATE INDEX %s ON %s (%s%s)' % (
+            schema_editor.quote_name(index_name(column)), table, schema_editor.quote_name(column), opclass))
+
+
+def drop_name_indexes(apps, schema_editor):
+    table = schema_editor.quote_name(apps.get_model('accounts', 'User')._meta.db_table)
+    for column in NAME_COLUMNS:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute('DROP INDEX %s ON %s' % (schema_editor.quote_name(index_name(column)), table))
+        else:
+            schema_editor.execute('DROP INDEX %s' % schema_editor.quote_name(index_name(column)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_indexes, drop_name_indexes),
+    ]
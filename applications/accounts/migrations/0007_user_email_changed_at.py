@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True,
+                                       verbose_name='Email Changed At'),
+        ),
+    ]
@@ -1,25 +1,88 @@
 # coding=utf-8
 
 import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model, login
 
+from allauth.socialaccount import providers
 from allauth.socialaccount.models import SocialLogin, SocialToken, SocialApp, SocialAccount
-from allauth.socialaccount.providers.facebook.views import fb_complete_login
+from allauth.socialaccount.providers.facebook.provider import FacebookProvider
+from allauth.socialaccount.providers.facebook.views import compute_appsecret_proof
 from allauth.socialaccount.providers.oauth2.views import OAuth2Adapter
 from allauth.socialaccount.helpers import complete_social_login
 
 from applications.accounts.serializer import UserProfileSerializer
+from utils.cache import TwoTierCache, hash_key
+from utils.graph import get_graph_client
+from utils.singleflight import SingleFlight
 
-FB_GRAPH_API_USER_DATA_URL = 'https://graph.facebook.com/me?fields=id,name&access_token='
+# Verified access token (hashed) -> Graph `/me` payload, shared by validation and signup.
+facebook_token_cache = TwoTierCache('fb-token',
+                                    maxsize=getattr(settings, 'FB_TOKEN_CACHE_SIZE', 10000),
+                                    ttl=getattr(settings, 'FB_TOKEN_CACHE_TTL', 300),
+                                    shared=getattr(settings, 'FB_TOKEN_CACHE_SHARED', True))
+
+# Concurrent duplicates of a login (same provider and token) share one verification and one login.
+token_verify_flights = SingleFlight()
+social_login_flights = SingleFlight()
+
+SOCIAL_LOGIN_BACKEND = 'allauth.account.auth_backends.AuthenticationBackend'
 
 
 class UserSocialRegisterMixin(OAuth2Adapter):
 
+    def get_facebook_user_data(self, access_token):
+        """
+        Returns the Graph `/me` payload for an access token, raises `requests.HTTPError`
+        when Graph rejects the token. Payloads of valid tokens are cached, so a login
+        costs at most one Graph call.
+        """
+        key = hash_key(access_token)
+        fb_user_data = facebook_token_cache.get(key)
+        if fb_user_data is None:
+            fb_user_data, shared = token_verify_flights.do(('facebook', key), self._fetch_facebook_user_data,
+                                                           key, access_token)
+        return fb_user_data
+
+    def _fetch_facebook_user_data(self, key, access_token):
+        # Signed like allauth's `fb_complete_login`, apps requiring the app secret proof reject unsigned calls.
+        app = SocialApp.objects.get(provider="facebook")
+        provider = providers.registry.by_id(FacebookProvider.id)
+        resp = get_graph_client().get('me', params={
+            'fields': ','.join(provider.get_fields()),
+            'access_token': access_token,
+            'appsecret_proof': compute_appsecret_proof(app, SocialToken(app=app, token=access_token)),
+        }, endpoint='me')
+        resp.raise_for_status()
+        fb_user_data = resp.json()
+        facebook_token_cache.set(key, fb_user_data)
+        return fb_user_data
+
+    def login_shared_user(self, request, data):
+        """
+        Logs in the user of a coalesced social login on the waiting request,
+        the leading request has already run `complete_social_login`.
+        """
+        if 'error' in data:
+            return data
+        user = get_user_model().objects.get(pk=data['id'])
+        user.backend = SOCIAL_LOGIN_BACKEND
+        login(request, user)
+        return data
+
     def facebook_signup(self, request, access_token):
+        data, shared = social_login_flights.do(('facebook', hash_key(access_token)), self._facebook_signup,
+                                               request, access_token)
+        return self.login_shared_user(request, data) if shared else data
+
+    def _facebook_signup(self, request, access_token):
         try:
             app = SocialApp.objects.get(provider="facebook")
             token = SocialToken(app=app, token=access_token)
 
-            fb_login = fb_complete_login(request, app, token)
+            fb_user_data = self.get_facebook_user_data(access_token)
+            provider = providers.registry.by_id(FacebookProvider.id)
+            fb_login = provider.sociallogin_from_response(request, fb_user_data)
             fb_login.token = token
             fb_login.state = SocialLogin.state_from_request(request)
 
@@ -50,9 +113,10 @@ class UserSocialRegisterMixin(OAuth2Adapter):
         request_data = request.data
         keys = request_data.keys()
 
-        url = FB_GRAPH_API_USER_DATA_URL+accesstoken
-        resp = requests.get(url=url)
-        fb_user_data = resp.json()
+        try:
+            fb_user_data = self.get_facebook_user_data(accesstoken)
+        except requests.HTTPError:
+            return False
         request_user_data = {'first_name':request_data.get('fname'),'last_name':request_data.get('lname'),'email':request_data.get('email')}
 
         valid = all(item in fb_user_data.items() for item in request_user_data.items())
@@ -61,9 +125,10 @@ class UserSocialRegisterMixin(OAuth2Adapter):
     def validate_social_account(self, access_token, provider):
         can_signup = False
         if provider == 'facebook':
-            url = FB_GRAPH_API_USER_DATA_URL+access_token
-            resp = requests.get(url=url)
-            fb_user_data = resp.json()
+            try:
+                fb_user_data = self.get_facebook_user_data(access_token)
+            except requests.HTTPError:
+                return (False,can_signup)
             if 'id' in fb_user_data.keys():
                 can_signup = True
                 uid = fb_user_data['id']
@@ -2,11 +2,18 @@
 
 from __future__ import unicode_literals
 
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from utils.constants import USER_ROLES, BECO_CUSTOMER
+from utils.helpers import normalize_email
+
+
+# Returned by `User._email_normalized_to_write` when `email_normalized` must be left as is.
+_UNCHANGED = object()
 
 
 class UserRoles(models.Model):
@@ -38,6 +45,15 @@ class User(AbstractUser):
     profile_image_url = models.CharField(verbose_name=_('Profile Image URL'), max_length=255, null=True, blank=True)
     dob = models.DateField(verbose_name=_('DOB'), null=True, blank=True)
     roles = models.ManyToManyField(UserRoles, verbose_name=_('User Roles'), blank=True)
+    # Lower-cased email, unique and indexed. NULL for blank emails and for
+    # duplicates awaiting `manage.py merge_duplicate_users`.
+    email_normalized = models.CharField(_('Normalized Email'), max_length=254, null=True, blank=True,
+                                        unique=True, editable=False)
+    # Set whenever the email is written, lets every worker's email Bloom filter pick up changed emails.
+    email_changed_at = models.DateTimeField(_('Email Changed At'), null=True, blank=True, db_index=True,
+                                            editable=False)
+    # Carried by signed API tokens, incrementing it revokes every refresh token of the user.
+    token_version = models.PositiveIntegerField(_('Token Version'), default=0, editable=False)
 
     class Meta:
         verbose_name_plural = _('Users')
@@ -45,5 +61,96 @@ class User(AbstractUser):
     def __unicode__(self):
         return self.get_username()
 
+    def __init__(self, *args, **kwargs):
+        super(User, self).__init__(*args, **kwargs)
+        self._remember_email()
+
+    def _remember_email(self):
+        # The email as read from the database, unknown while the field is deferred.
+        if 'email' in self.__dict__:
+            self._loaded_email = self.email
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(User, self).refresh_from_db(*args, **kwargs)
+        self._remember_email()
+
+    def _email_normalized_to_write(self):
+        """
+        Returns the `email_normalized` to save along with the email, or
+        `_UNCHANGED`. A changed email always claims its normalized form (a
+        taken one fails the save), an unchanged one only when no other user
+        holds it, so saving a duplicate awaiting `merge_duplicate_users` keeps
+        its NULL.
+        """
+        normalized = normalize_email(self.email) or None
+        if self._state.adding or ('_loaded_email' in self.__dict__ and self.email != self._loaded_email):
+            return normalized
+        if normalized == self.email_normalized:
+            return _UNCHANGED
+        if normalized is not None and type(self)._default_manager.filter(
+                email_normalized=normalized).exclude(pk=self.pk).exists():
+            return _UNCHANGED
+        return normalized
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'email' in update_fields:
+            normalized = self._email_normalized_to_write()
+            if normalized is not _UNCHANGED:
+                self.email_normalized = normalized
+                self.email_changed_at = timezone.now()
+                if update_fields is not None:
+                    kwargs['update_fields'] = list(update_fields) + ['email_normalized', 'email_changed_at']
+        # `set_password` keeps the new raw password until saved, a password change revokes issued tokens.
+        if self._password is not None and (update_fields is None or 'password' in update_fields):
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = list(kwargs['update_fields']) + ['token_version']
+        super(User, self).save(*args, **kwargs)
+        if update_fields is None or 'email' in update_fields:
+            self._remember_email()
+
 field = User._meta.get_field('username')
 field.max_length = 254
+
+
+class FacebookPagePost(models.Model):
+    """
+    Outbox of messages to publish on a Facebook page.
+
+    Requests only enqueue rows, the `publish_page_posts` command publishes
+    them in Graph batch requests and records the outcome per row.
+    """
+
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('User'), null=True, blank=True,
+                             on_delete=models.SET_NULL, related_name='page_posts')
+    page_id = models.CharField(_('Page ID'), max_length=64)
+    message = models.TextField(_('Message'))
+    idempotency_key = models.CharField(_('Idempotency Key'), max_length=64, unique=True)
+    status = models.CharField(_('Status'), choices=STATUS_CHOICES, max_length=25, default=PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('Next Attempt At'), default=timezone.now)
+    claim_token = models.CharField(_('Claim Token'), max_length=32, null=True, blank=True, db_index=True)
+    post_id = models.CharField(_('Post ID'), max_length=255, null=True, blank=True)
+    last_error = models.TextField(_('Last Error'), null=True, blank=True)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        verbose_name_plural = _('Facebook Page Posts')
+        index_together = [('status', 'next_attempt_at')]
+
+    def __unicode__(self):
+        return '%s (%s)' % (self.idempotency_key, self.status)
@@ -0,0 +1,115 @@
+# coding=utf-8
+
+import json
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import urlencode
+
+from applications.accounts.models import FacebookPagePost
+from utils.cache import hash_key
+from utils.graph import get_graph_client
+
+# Graph accepts at most 50 requests per batch call.
+GRAPH_BATCH_LIMIT = 50
+
+PAGE_POST_MAX_ATTEMPTS = getattr(settings, 'FB_PAGE_POST_MAX_ATTEMPTS', 5)
+PAGE_POST_RETRY_BACKOFF = getattr(settings, 'FB_PAGE_POST_RETRY_BACKOFF', 30)
+# Rows left in `sending` by a crashed worker are picked up again after this many seconds.
+PAGE_POST_CLAIM_LEASE = getattr(settings, 'FB_PAGE_POST_CLAIM_LEASE', 300)
+
+
+def enqueue_page_post(user, page_id, message, idempotency_key=None):
+    """
+    Stores a page post in the outbox and returns it.
+    Re-submitting an idempotency key returns the existing row instead of posting twice.
+    """
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    if len(idempotency_key) > 64:
+        idempotency_key = hash_key(idempotency_key)
+    try:
+        with transaction.atomic():
+            return FacebookPagePost.objects.create(user=user, page_id=page_id, message=message,
+                                                   idempotency_key=idempotency_key)
+    except IntegrityError:
+        return FacebookPagePost.objects.get(idempotency_key=idempotency_key)
+
+
+def claim_page_posts(batch_size):
+    """ Marks up to `batch_size` due posts as `sending` for this worker and returns them. """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = Q(status=FacebookPagePost.PENDING) | Q(status=FacebookPagePost.SENDING)
+    ids = list(FacebookPagePost.objects.filter(due, next_attempt_at__lte=now)
+               .order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # The status/next_attempt_at filter is repeated so concurrent workers never claim the same row.
+    FacebookPagePost.objects.filter(due, id__in=ids, next_attempt_at__lte=now).update(
+        status=FacebookPagePost.SENDING, claim_token=token,
+        next_attempt_at=now + timedelta(seconds=PAGE_POST_CLAIM_LEASE))
+    return list(FacebookPagePost.objects.filter(claim_token=token, status=FacebookPagePost.SENDING))
+
+
+def _retry_or_fail(post, error, max_attempts):
+    post.attempts += 1
+    post.last_error = error
+    if post.attempts >= max_attempts:
+        post.status = FacebookPagePost.FAILED
+    else:
+        post.status = FacebookPagePost.PENDING
+        delay = PAGE_POST_RETRY_BACKOFF * (2 ** (post.attempts - 1))
+        post.next_attempt_at = timezone.now() + timedelta(seconds=random.uniform(delay / 2.0, delay))
+    post.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+
+def _mark_sent(post, body):
+    post.attempts += 1
+    post.status = FacebookPagePost.SENT
+    post.post_id = body.get('id')
+    post.last_error = None
+    post.save(update_fields=['attempts', 'status', 'post_id', 'last_error', 'updated_at'])
+
+
+def publish_page_posts(batch_size=GRAPH_BATCH_LIMIT, max_attempts=PAGE_POST_MAX_ATTEMPTS):
+    """
+    Publishes one batch of due page posts with a single Graph batch request.
+    Returns a dict with the number of sent, retried and failed posts.
+    """
+    posts = claim_page_posts(min(batch_size, GRAPH_BATCH_LIMIT))
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    if not posts:
+        return result
+
+    batch = [{
+        'method': 'POST',
+        'relative_url': '%s/feed' % post.page_id,
+        'body': urlencode({'message': post.message.encode('utf-8')}),
+    } for post in posts]
+
+    try:
+        resp = get_graph_client().post('', data={
+            'access_token': getattr(settings, 'FB_PAGE_ACCESS_TOKEN', ''),
+            'batch': json.dumps(batch),
+        }, endpoint='batch')
+        responses = resp.json() if resp.status_code == 200 else None
+        batch_error = None if isinstance(responses, list) else resp.text
+    except Exception as e:
+        responses, batch_error = None, str(e)
+
+    for index, post in enumerate(posts):
+        item = responses[index] if batch_error is None and index < len(responses) else None
+        if item is not None and item.get('code') == 200:
+            _mark_sent(post, json.loads(item.get('body') or '{}'))
+            result['sent'] += 1
+            continue
+        # A null item means Graph timed out on it, the post is retried like a failed one.
+        error = batch_error or (item.get('body') if item else 'No response from Graph batch request.')
+        _retry_or_fail(post, error, max_attempts)
+        result['failed' if post.status == FacebookPagePost.FAILED else 'retried'] += 1
+    return result
@@ -0,0 +1,129 @@
+# coding=utf-8
+
+"""
+Versioned cache of serialized user profiles.
+
+Payloads are keyed by user id, serializer and a per-user profile version.
+Every write to the user, its roles or social accounts replaces the version
+once the transaction commits, so readers never see a payload older than
+the last write; superseded payloads simply expire.
+"""
+
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from utils.cache import TwoTierCache, hash_key
+
+PROFILE_CACHE_TTL = getattr(settings, 'PROFILE_CACHE_TTL', 600)
+# Versions must be visible to every worker, so a per-process default cache disables caching.
+PROFILE_CACHE_ENABLED = getattr(settings, 'PROFILE_CACHE_ENABLED',
+                                'locmem' not in settings.CACHES['default']['BACKEND'].lower())
+
+profile_payloads = TwoTierCache('profile', maxsize=getattr(settings, 'PROFILE_CACHE_SIZE', 10000),
+                                ttl=PROFILE_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def profile_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / float(lookups), 4) if lookups else None
+    return stats
+
+
+def _version_key(user_id):
+    return 'profile-version:%s' % user_id
+
+
+def get_profile_version(user_id):
+    """
+    Returns the current profile version of a user.
+    A version lost from the cache is replaced by a new random one, never reset to an old value.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_profile_version(user_id):
+    """ Invalidates every cached profile of a user once the current transaction commits. """
+    def bump():
+        cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+        _count('invalidations')
+    transaction.on_commit(bump)
+
+
+def bump_profile_versions(user_ids):
+    """ `bump_profile_version` of many users, with one cache round trip. """
+    user_ids = list(user_ids)
+
+    def bump():
+        cache.set_many(dict((_version_key(user_id), uuid.uuid4().hex) for user_id in user_ids), None)
+        with _stats_lock:
+            _stats['invalidations'] += len(user_ids)
+    transaction.on_commit(bump)
+
+
+def _payload_key(user, serializer_class, version, fields, omit):
+    from applications.accounts.serializer import selection_key
+
+    return '%s:%s:%s:%s' % (user.pk, serializer_class.__name__, selection_key(fields, omit), version)
+
+
+def profile_etag(user, serializer_class, version=None, fields=None, omit=None):
+    """
+    Returns a strong ETag of a user's profile payload computed from the profile
+    version alone, or None when versions are not shared between workers.
+    """
+    if not PROFILE_CACHE_ENABLED:
+        return None
+    version = version or get_profile_version(user.pk)
+    return quote_etag(hash_key(_payload_key(user, serializer_class, version, fields, omit))[:32])
+
+
+def get_cached_profile(user, serializer_class, version=None, fields=None, omit=None):
+    """
+    Returns `serializer_class(user, fields=fields, omit=omit).data`, from the
+    cache when the profile has not changed.
+    On a miss the user is re-read after the version, so a user object loaded
+    before a concurrent write is never cached under the new version.
+    Pass the `version` an ETag was computed from to keep both consistent.
+    """
+    from applications.accounts.fast_serializer import represent_profile
+    from applications.accounts.serializer import with_profile_relations
+
+    serializer = serializer_class(fields=fields, omit=omit)
+    if not PROFILE_CACHE_ENABLED:
+        return represent_profile(serializer, user)
+
+    version = version or get_profile_version(user.pk)
+    key = _payload_key(user, serializer_class, version, fields, omit)
+    data = profile_payloads.get(key)
+    if data is not None:
+        _count('hits')
+        return data
+
+    _count('misses')
+    fresh = with_profile_relations(get_user_model().objects.filter(pk=user.pk), serializer.fields).first()
+    if fresh is None:
+        return represent_profile(serializer, user)
+    data = represent_profile(serializer, fresh)
+    profile_payloads.set(key, data)
+    return data
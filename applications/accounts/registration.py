@@ -0,0 +1,93 @@
+# coding=utf-8
+
+"""
+Bulk user registration for partners.
+
+A batch costs a constant number of queries: one set-based lookup of taken
+emails, one `bulk_create` and one read back of the new ids. Passwords are
+hashed by `utils.passwords.make_passwords`.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from applications.accounts.email_index import email_index
+from applications.accounts.generator import lookup_ids
+from applications.accounts.serializer import UserBulkRegisterSerializer
+from utils.helpers import normalize_email
+from utils.passwords import make_passwords
+
+User = get_user_model()
+
+BULK_REGISTER_MAX_USERS = getattr(settings, 'BULK_REGISTER_MAX_USERS', 1000)
+
+EMAIL_EXISTS = {'email': ['User with this email already exists.']}
+EMAIL_REPEATED = {'email': ['This email appears more than once in the request.']}
+
+
+def _error(errors):
+    return {'status': 'error', 'errors': errors}
+
+
+def _taken_emails(emails, usernames):
+    """
+    Returns the normalized emails among `emails` already used as an email,
+    or whose address as typed (`usernames`) is already a username.
+    """
+    return set(lookup_ids(User.objects.all(), 'email_normalized', emails)) | \
+        set(normalize_email(username) for username in lookup_ids(User.objects.all(), 'username', usernames))
+
+
+def bulk_register(rows):
+    """
+    Registers a list of users given as `UserBulkRegisterSerializer` data.
+    Returns one result per row, in order: `{'status': 'created', 'id': ...}`
+    or `{'status': 'error', 'errors': {...}}`.
+    """
+    results = [None] * len(rows)
+    pending = {}
+    for index, row in enumerate(rows):
+        serializer = UserBulkRegisterSerializer(data=row)
+        if not serializer.is_valid():
+            results[index] = _error(serializer.errors)
+            continue
+        email = normalize_email(serializer.validated_data['email'])
+        if email in pending:
+            results[index] = _error(EMAIL_REPEATED)
+            continue
+        pending[email] = (index, serializer.validated_data)
+
+    for email in _taken_emails(list(pending), [data['email'] for index, data in pending.values()]):
+        results[pending.pop(email)[0]] = _error(EMAIL_EXISTS)
+
+    emails = list(pending)
+    hashes = make_passwords([pending[email][1]['password'] for email in emails])
+    users = []
+    for email, password_hash in zip(emails, hashes):
+        data = pending[email][1]
+        # Stored as typed, like single registrations, only `email_normalized` is lower-cased.
+        users.append(User(username=data['email'], email=data['email'], email_normalized=email, password=password_hash,
+                          first_name=data['fname'], last_name=data['lname'], mobile=data.get('phone') or None))
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+            # A concurrent registration took some of the emails, report them and insert the others.
+            taken = _taken_emails([user.email_normalized for user in users], [user.username for user in users])
+            for email in taken:
+                results[pending.pop(email)[0]] = _error(EMAIL_EXISTS)
+            users = [user for user in users if user.email_normalized not in taken]
+
+    # bulk_create does not return primary keys on every backend, read them back.
+    ids = lookup_ids(User.objects.all(), 'email_normalized', [user.email_normalized for user in users])
+    for user in users:
+        # bulk_create sends no post_save.
+        email_index.add(user.email)
+        results[pending[user.email_normalized][0]] = {'status': 'created', 'id': ids[user.email_normalized]}
+    return results
@@ -1,17 +1,195 @@
 # coding=utf-8
 
 import datetime
+import time
+from collections import OrderedDict
 
 from allauth.socialaccount.models import SocialAccount
 from django.contrib.auth import authenticate
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.hashers import check_password
+from django.db.models import Prefetch, QuerySet
 
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from rest_framework.fields import SkipField
+from rest_framework.settings import api_settings
+
+from applications.accounts.email_index import email_index
+from applications.accounts.models import UserRoles
+from applications.accounts.profile_cache import bump_profile_version
+from utils.helpers import normalize_email
+from utils.instrumentation import timed
+from utils.passwords import PASSWORD_HASH_RETRY_AFTER, HashingBusy, hashing_slot
 
 User = get_user_model()
 
+OAUTH_PROVIDERS = ('facebook', 'google')
+
+# Debug instrumentation: reports the queries and time spent per field in an `X-Field-Cost` response header.
+SERIALIZER_FIELD_COSTS = getattr(settings, 'SERIALIZER_FIELD_COSTS', False)
+
+EMAIL_TAKEN = _('User with this email already exists.')
+
+
+def email_taken():
+    """
+    The validation error of a registration losing the race for its email:
+    the unique `email_normalized` rejected a user the email check let through.
+    """
+    return serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [EMAIL_TAKEN]})
+
+
+def with_profile_relations(queryset, fields=('oauth', 'roles')):
+    """
+    Prefetches the linked social providers and role names of every user, so
+    profile serializers need a constant number of queries for any number of users.
+    Only relations used by the serializer `fields` are prefetched.
+    """
+    lookups = []
+    if 'oauth' in fields:
+        lookups.append(Prefetch('socialaccount_set', to_attr='prefetched_social_accounts',
+                                queryset=SocialAccount.objects.filter(provider__in=OAUTH_PROVIDERS)
+                                .only('user', 'provider')))
+    if 'roles' in fields:
+        lookups.append(Prefetch('roles', to_attr='prefetched_roles', queryset=UserRoles.objects.only('name')))
+    # Applying it twice would repeat the lookups, which Django rejects for prefetches with a queryset.
+    seen = set(getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups)
+    return queryset.prefetch_related(*[lookup for lookup in lookups if lookup.prefetch_to not in seen])
+
+
+def linked_providers(user):
+    """ Returns the set of social providers linked to a user, from prefetched rows when available. """
+    accounts = getattr(user, 'prefetched_social_accounts', None)
+    if accounts is not None:
+        return set(account.provider for account in accounts)
+    return set(SocialAccount.objects.filter(user_id=user.id, provider__in=OAUTH_PROVIDERS)
+               .values_list('provider', flat=True).distinct())
+
+
+def role_names(user):
+    roles = getattr(user, 'prefetched_roles', None)
+    if roles is not None:
+        return [role.name for role in roles]
+    return list(user.roles.all().values_list('name', flat=True))
+
+
+class ProfileListSerializer(serializers.ListSerializer):
+
+    """
+    List serializer applying `with_profile_relations` to querysets,
+    so `many=True` profile serialization does not run queries per user.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, QuerySet):
+            data = with_profile_relations(data, self.child.fields)
+        return super(ProfileListSerializer, self).to_representation(data)
+
+
+def requested_fields(request):
+    """ Returns the `(fields, omit)` selections of the `?fields=` and `?omit=` params of a request. """
+    def selection(param):
+        value = request.query_params.get(param) if request is not None else None
+        if not value:
+            return None
+        return tuple(sorted(set(name.strip() for name in value.split(',') if name.strip())))
+    return selection('fields'), selection('omit')
+
+
+def selection_key(fields=None, omit=None):
+    return '%s;%s' % (','.join(fields or ('*',)), ','.join(omit or ()))
+
+
+def format_field_costs(field_costs):
+    return ', '.join('%s;queries=%d;dur=%.2f' % (name, queries, duration)
+                     for name, (queries, duration) in field_costs.items())
+
+
+class SparseFieldsMixin(object):
+
+    """
+    Serializes only the fields selected with the `fields` and `omit`
+    arguments, or else with the `?fields=` and `?omit=` params of the context
+    request. Other fields are dropped before serialization, so unrequested
+    method fields never run their queries.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        omit = kwargs.pop('omit', None)
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+        if fields is None and omit is None:
+            fields, omit = requested_fields(self.context.get('request'))
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or (omit and name in omit):
+                self.fields.pop(name)
+        # `{field name: [queries, milliseconds]}`, summed over every serialized instance.
+        self.field_costs = OrderedDict()
+
+    def to_representation(self, instance):
+        if not SERIALIZER_FIELD_COSTS:
+            with timed('serializer'):
+                return super(SparseFieldsMixin, self).to_representation(instance)
+
+        # Queries are counted on the debug cursor's `queries_log`, as `utils.instrumentation.RequestTrace` does.
+        ret = OrderedDict()
+        force_debug_cursor = connection.force_debug_cursor
+        if not connection.queries_logged:
+            connection.queries_log.clear()
+        connection.force_debug_cursor = True
+        try:
+            for field in self._readable_fields:
+                queries_before, started = len(connection.queries_log), time.time()
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                ret[field.field_name] = None if attribute is None else field.to_representation(attribute)
+                cost = self.field_costs.setdefault(field.field_name, [0, 0.0])
+                cost[0] += len(connection.queries_log) - queries_before
+                cost[1] += (time.time() - started) * 1000
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+        return ret
+
+
+class OAuthStatusMixin(object):
+
+    def get_oauth(self, obj):
+        providers = linked_providers(obj)
+        return {
+            'facebook': 'facebook' in providers,
+            'google': 'google' in providers
+        }
+
+
+class ChangedFieldsMixin(object):
+
+    def save_changes(self, instance, values, password=None):
+        """
+        Sets the model fields of `values` that differ from `instance` (plus a
+        new `password` when given) and saves only those. An unchanged update
+        writes nothing. Returns the names of the changed fields.
+        """
+        changed = [name for name, value in values.items() if getattr(instance, name) != value]
+        for name in changed:
+            setattr(instance, name, values[name])
+        if password:
+            instance.set_password(password)
+            changed.append('password')
+        if changed:
+            try:
+                with transaction.atomic():
+                    instance.save(update_fields=changed)
+            except IntegrityError:
+                # Another request took the email after `validate_email` checked it.
+                raise serializers.ValidationError({'email': [EMAIL_TAKEN]})
+            bump_profile_version(instance.pk)
+        return changed
+
 
 class UserLoginSerializer(serializers.Serializer):
 
@@ -28,7 +206,12 @@ class UserLoginSerializer(serializers.Serializer):
         password = attrs.get('password')
 
         if email and password:
-            user = authenticate(username=email, password=password)
+            try:
+                with hashing_slot():
+                    user = authenticate(username=email, password=password)
+            except HashingBusy:
+                raise exceptions.Throttled(wait=PASSWORD_HASH_RETRY_AFTER,
+                                           detail=_('Too many concurrent logins, please retry shortly.'))
         else:
             raise serializers.ValidationError(_('Invalid credentials.'))
 
@@ -66,11 +249,8 @@ class UserEmailRegisterSerializer(serializers.Serializer):
             if not password or password == '':
                 raise serializers.ValidationError(_('Password should not be empty.'))
 
-        try:
-            User.objects.get(email=email)
+        if email_index.exists(email):
             raise serializers.ValidationError(_('User with this email already exists.'))
-        except User.DoesNotExist:
-            pass
 
         return data
 
@@ -78,13 +258,17 @@ class UserEmailRegisterSerializer(serializers.Serializer):
         validated_data.update({
             'username':validated_data['email']
         })
-        user = User.objects.create(username=validated_data['username'],
-                                   first_name=validated_data['fname'],
-                                   last_name=validated_data['lname'],
-                                   email=validated_data['email'],
-                                   mobile=validated_data.get('phone',None))
-        user.set_password(validated_data['password'])
-        user.save()
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username=validated_data['username'],
+                                           first_name=validated_data['fname'],
+                                           last_name=validated_data['lname'],
+                                           email=validated_data['email'],
+                                           mobile=validated_data.get('phone',None))
+                user.set_password(validated_data['password'])
+                user.save()
+        except IntegrityError:
+            raise email_taken()
         return user
 
 
@@ -119,11 +303,8 @@ class UserEmailRegisterV2Serializer(serializers.Serializer):
             if not password or password == '':
                 raise serializers.ValidationError(_('Password should not be empty.'))
 
-        try:
-            User.objects.get(email=email)
+        if email_index.exists(email):
             raise serializers.ValidationError(_('User with this email already exists.'))
-        except User.DoesNotExist:
-            pass
 
         return data
 
@@ -132,22 +313,40 @@ class UserEmailRegisterV2Serializer(serializers.Serializer):
         validated_data.update({
             'username':validated_data['email']
         })
-        user = User.objects.create(username=validated_data['username'],
-                                   first_name=validated_data['fname'],
-                                   last_name=validated_data['lname'],
-                                   email=validated_data['email'],
-                                   gender=validated_data.get('gender',None),
-                                   mobile=validated_data.get('phone',None))
-
-        if dob:
-            user_dob = datetime.datetime.strptime(dob, "%d/%m/%Y").date()
-            user.dob = user_dob
-        user.set_password(validated_data['password'])
-        user.save()
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username=validated_data['username'],
+                                           first_name=validated_data['fname'],
+                                           last_name=validated_data['lname'],
+                                           email=validated_data['email'],
+                                           gender=validated_data.get('gender',None),
+                                           mobile=validated_data.get('phone',None))
+
+                if dob:
+                    user_dob = datetime.datetime.strptime(dob, "%d/%m/%Y").date()
+                    user.dob = user_dob
+                user.set_password(validated_data['password'])
+                user.save()
+        except IntegrityError:
+            raise email_taken()
         return user
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserBulkRegisterSerializer(serializers.Serializer):
+
+    """
+    Serializer for one user of a bulk registration.
+    Email uniqueness is checked for the whole batch by `bulk_register`.
+    """
+
+    fname = serializers.CharField()
+    lname = serializers.CharField()
+    phone = serializers.CharField(required=False, allow_blank=True)
+    email = serializers.EmailField()
+    password = serializers.CharField()
+
+
+class UserProfileSerializer(SparseFieldsMixin, OAuthStatusMixin, serializers.ModelSerializer):
 
     """
     Serializer for retrieving user profile details.
@@ -162,6 +361,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'fname', 'lname','email','role', 'phone', 'address','oauth')
+        list_serializer_class = ProfileListSerializer
 
     def get_fname(self, obj):
         return '%s'%(obj.first_name)
@@ -175,16 +375,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_address(self, obj):
         return ""
 
-    def get_oauth(self, obj):
-        as_fb_user = SocialAccount.objects.filter(user_id= obj.id, provider='facebook')
-        as_gp_user = SocialAccount.objects.filter(user_id= obj.id, provider='google')
-        return {
-            'facebook':as_fb_user.count() > 0,
-            'google':as_gp_user.count() > 0
-        }
-
 
-class UserProfileV2Serializer(serializers.ModelSerializer):
+class UserProfileV2Serializer(SparseFieldsMixin, OAuthStatusMixin, serializers.ModelSerializer):
 
     """
     Serializer for retrieving user profile details.
@@ -204,6 +396,7 @@ class UserProfileV2Serializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'fname', 'lname','email','role', 'phone', 'address','oauth', 'gender', 'checkins', 'points', 'image_url', 'dob')
+        list_serializer_class = ProfileListSerializer
 
     def get_fname(self, obj):
         return '%s'%(obj.first_name)
@@ -220,19 +413,11 @@ class UserProfileV2Serializer(serializers.ModelSerializer):
     def get_dob(self, obj):
         return obj.dob.strftime('%d/%m/%Y') if obj.dob else ""
 
-    def get_oauth(self, obj):
-        as_fb_user = SocialAccount.objects.filter(user_id= obj.id, provider='facebook')
-        as_gp_user = SocialAccount.objects.filter(user_id= obj.id, provider='google')
-        return {
-            'facebook':as_fb_user.count() > 0,
-            'google':as_gp_user.count() > 0
-        }
-
     def get_image_url(self, obj):
         return obj.profile_image_url if obj.profile_image_url else ''
 
 
-class UserProfileV3Serializer(serializers.ModelSerializer):
+class UserProfileV3Serializer(SparseFieldsMixin, OAuthStatusMixin, serializers.ModelSerializer):
 
     """
     Serializer for retrieving user profile details.
@@ -255,6 +440,7 @@ class UserProfileV3Serializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'fname', 'lname','email','roles', 'phone', 'address','oauth', 'gender', 'checkins', 'points',
                   'image_url', 'dob', 'stores')
+        list_serializer_class = ProfileListSerializer
 
     def get_fname(self, obj):
         return '%s'%(obj.first_name)
@@ -266,7 +452,7 @@ class UserProfileV3Serializer(serializers.ModelSerializer):
         return '%s'%(obj.mobile) if obj.mobile else ''
 
     def get_roles(self, obj):
-        return obj.roles.all().values_list('name', flat=True)
+        return role_names(obj)
 
     def get_address(self, obj):
         return ""
@@ -274,19 +460,11 @@ class UserProfileV3Serializer(serializers.ModelSerializer):
     def get_dob(self, obj):
         return obj.dob.strftime('%d/%m/%Y') if obj.dob else ""
 
-    def get_oauth(self, obj):
-        as_fb_user = SocialAccount.objects.filter(user_id= obj.id, provider='facebook')
-        as_gp_user = SocialAccount.objects.filter(user_id= obj.id, provider='google')
-        return {
-            'facebook':as_fb_user.count() > 0,
-            'google':as_gp_user.count() > 0
-        }
-
     def get_image_url(self, obj):
         return obj.profile_image_url if obj.profile_image_url else ''
 
 
-class UserProfileUpdateSerializer(serializers.Serializer):
+class UserProfileUpdateSerializer(ChangedFieldsMixin, serializers.Serializer):
 
     """
     Serializer for editing user profile details.
@@ -302,33 +480,28 @@ class UserProfileUpdateSerializer(serializers.Serializer):
     def validate_password(self, value):
         request = self.context.get('request', None)
         password = value
-        is_same_password = check_password(password, request.user.password)
-        if is_same_password:
+        # Blank passwords leave the password unchanged, only a new one is worth a PBKDF2 comparison.
+        if password and check_password(password, request.user.password):
             raise serializers.ValidationError('You cannot use current password. Please try another.')
         return password
 
     def validate_email(self, value):
         request = self.context.get('request', None)
-        if not value == request.user.email:
-            try:
-                User.objects.get(email=value)
-                raise serializers.ValidationError('User with this email already exists.')
-            except User.DoesNotExist:
-                pass
+        if normalize_email(value) != normalize_email(request.user.email) and email_index.exists(value):
+            raise serializers.ValidationError('User with this email already exists.')
         return value
 
     def update(self, instance, validated_data):
-        instance.first_name = validated_data['fname']
-        instance.last_name = validated_data['lname']
-        instance.email = validated_data['email']
-        instance.mobile = validated_data['phone']
-        password = validated_data.get('password')
-        if validated_data.get('password'):
-            instance.set_password(password)
-        instance.save()
+        self.save_changes(instance, {
+            'first_name': validated_data['fname'],
+            'last_name': validated_data['lname'],
+            'email': validated_data['email'],
+            'mobile': validated_data['phone'],
+        }, password=validated_data.get('password'))
+        return instance
 
 
-class UserProfileUpdateV2Serializer(serializers.Serializer):
+class UserProfileUpdateV2Serializer(ChangedFieldsMixin, serializers.Serializer):
 
     """
     Serializer for editing user profile details.
@@ -346,36 +519,32 @@ class UserProfileUpdateV2Serializer(serializers.Serializer):
     def validate_password(self, value):
         request = self.context.get('request', None)
         password = value
-        is_same_password = check_password(password, request.user.password)
-        if is_same_password:
+        # Blank passwords leave the password unchanged, only a new one is worth a PBKDF2 comparison.
+        if password and check_password(password, request.user.password):
             raise serializers.ValidationError('You cannot use current password. Please try another.')
         return password
 
     def validate_email(self, value):
         request = self.context.get('request', None)
-        if not value == request.user.email:
-            try:
-                User.objects.get(email=value)
-                raise serializers.ValidationError('User with this email already exists.')
-            except User.DoesNotExist:
-                pass
+        if normalize_email(value) != normalize_email(request.user.email) and email_index.exists(value):
+            raise serializers.ValidationError('User with this email already exists.')
         return value
 
     def update(self, instance, validated_data):
-        instance.first_name = validated_data['fname']
-        instance.last_name = validated_data['lname']
-        instance.email = validated_data['email']
-        instance.mobile = validated_data['phone']
-        instance.gender = validated_data.get('gender')
-        password = validated_data.get('password')
-        if validated_data.get('password'):
-            instance.set_password(password)
+        values = {
+            'first_name': validated_data['fname'],
+            'last_name': validated_data['lname'],
+            'email': validated_data['email'],
+            'mobile': validated_data['phone'],
+            'gender': validated_data.get('gender'),
+        }
         if validated_data.get('dob'):
-            instance.dob = datetime.datetime.strptime(validated_data.get('dob'), "%d/%m/%Y").date()
-        instance.save()
+            values['dob'] = datetime.datetime.strptime(validated_data.get('dob'), "%d/%m/%Y").date()
+        self.save_changes(instance, values, password=validated_data.get('password'))
+        return instance
 
 
-class FBProfileSerializer(serializers.Serializer):
+class FBProfileSerializer(ChangedFieldsMixin, serializers.Serializer):
 
     """
     Serializer for editing user profile details.
@@ -388,8 +557,10 @@ class FBProfileSerializer(serializers.Serializer):
     address = serializers.CharField(required=False, allow_blank=True)
 
     def update(self, instance, validated_data):
-        instance.first_name = validated_data['fname']
-        instance.last_name = validated_data['lname']
-        instance.email = validated_data['email']
-        instance.mobile = validated_data['phone']
-        instance.save()
+        self.save_changes(instance, {
+            'first_name': validated_data['fname'],
+            'last_name': validated_data['lname'],
+            'email': validated_data['email'],
+            'mobile': validated_data['phone'],
+        })
+        return instance
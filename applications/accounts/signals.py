@@ -0,0 +1,41 @@
+# coding=utf-8
+
+from allauth.socialaccount.models import SocialAccount
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from applications.accounts.email_index import email_index
+from applications.accounts.models import User
+from applications.accounts.profile_cache import bump_profile_version
+
+
+@receiver(post_save, sender=User, dispatch_uid='accounts.user_saved')
+def user_saved(sender, instance, **kwargs):
+    bump_profile_version(instance.pk)
+    email_index.add(instance.email)
+
+
+@receiver(post_delete, sender=User, dispatch_uid='accounts.user_deleted')
+def user_deleted(sender, instance, **kwargs):
+    # Drops the cached user object, `EmailAuthBackend.get_user` must stop returning it.
+    bump_profile_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.roles.through, dispatch_uid='accounts.user_roles_changed')
+def user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # A role is being cleared of all its users, collect them before the rows are gone.
+        user_ids = sender.objects.filter(userroles_id=instance.pk).values_list('user_id', flat=True)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        # Changed from the role side `pk_set` holds the affected users (None after a clear).
+        user_ids = (pk_set or []) if reverse else [instance.pk]
+    else:
+        return
+    for user_id in user_ids:
+        bump_profile_version(user_id)
+
+
+@receiver(post_save, sender=SocialAccount, dispatch_uid='accounts.social_account_saved')
+@receiver(post_delete, sender=SocialAccount, dispatch_uid='accounts.social_account_deleted')
+def social_account_changed(sender, instance, **kwargs):
+    bump_profile_version(instance.user_id)
@@ -0,0 +1,100 @@
+# coding=utf-8
+
+import requests
+from allauth.socialaccount.models import SocialAccount
+from django.test import SimpleTestCase, TestCase
+
+from applications.accounts.models import User, UserRoles
+from applications.accounts.serializer import UserProfileV3Serializer, with_profile_relations
+from utils.graph import GraphClient
+
+# Fields of UserProfileV3Serializer backed by neither a getter nor a user attribute.
+UNBACKED_FIELDS = ('checkins', 'points', 'stores')
+
+
+class ProfileSerializerQueryCountTest(TestCase):
+
+    def setUp(self):
+        self.roles = [UserRoles.objects.create(name='customer'), UserRoles.objects.create(name='admin')]
+
+    def create_users(self, count):
+        start = User.objects.count()
+        for n in range(start, start + count):
+            user = User.objects.create(username='user%d@example.com' % n, email='user%d@example.com' % n)
+            user.roles.add(*self.roles[:n % 2 + 1])
+            SocialAccount.objects.create(user=user, provider='facebook', uid=str(n))
+            if n % 3 == 0:
+                SocialAccount.objects.create(user=user, provider='google', uid='g%d' % n)
+
+    def serialize(self):
+        queryset = with_profile_relations(User.objects.order_by('id'))
+        # One query for the users, one per prefetched relation.
+        with self.assertNumQueries(3):
+            return UserProfileV3Serializer(queryset, many=True, omit=UNBACKED_FIELDS).data
+
+    def test_query_count_does_not_grow_with_users(self):
+        self.create_users(5)
+        data = self.serialize()
+        self.assertEqual(len(data), 5)
+        self.create_users(5)
+        data = self.serialize()
+        self.assertEqual(len(data), 10)
+
+        first = data[0]
+        self.assertEqual(first['oauth'], {'facebook': True, 'google': True})
+        self.assertEqual(sorted(first['roles']), ['customer'])
+        self.assertEqual(sorted(data[1]['roles']), ['admin', 'customer'])
+
+
+class GraphClientRetryTest(SimpleTestCase):
+
+    def failing_client(self, error):
+        client = GraphClient(base_url='https://graph.invalid', max_retries=2, backoff=0)
+        calls = []
+
+        def request(method, url, **kwargs):
+            calls.append(method)
+            raise error
+
+        client.session.request = request
+        return client, calls
+
+    def test_post_is_retried_after_connect_timeout(self):
+        client, calls = self.failing_client(requests.exceptions.ConnectTimeout('connect timed out'))
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            client.post('me/feed', endpoint='feed', data={'message': 'hello'})
+        self.assertEqual(calls, ['POST'] * 3)
+        stats = client.stats.snapshot()['feed']
+        self.assertEqual((stats['calls'], stats['errors'], stats['retries']), (1, 1, 2))
+
+    def test_post_is_not_retried_after_read_timeout(self):
+        client, calls = self.failing_client(requests.exceptions.ReadTimeout('read timed out'))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            client.post('me/feed', endpoint='feed', data={'message': 'hello'})
+        self.assertEqual(calls, ['POST'])
+        self.assertEqual(client.stats.snapshot()['feed']['errors'], 1)
+
+
+class EmailNormalizedSaveTest(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner@example.com', email='Same@example.com')
+        # A duplicate the backfill left without `email_normalized`, awaiting `merge_duplicate_users`.
+        self.duplicate = User.objects.create(username='duplicate@example.com', email='other@example.com')
+        User.objects.filter(pk=self.duplicate.pk).update(email='same@example.com', email_normalized=None)
+        self.duplicate = User.objects.get(pk=self.duplicate.pk)
+
+    def test_full_save_of_duplicate_keeps_null(self):
+        self.duplicate.first_name = 'Dupe'
+        self.duplicate.save()
+        self.assertIsNone(User.objects.get(pk=self.duplicate.pk).email_normalized)
+
+    def test_changed_email_is_normalized(self):
+        self.duplicate.email = 'New@Example.com'
+        self.duplicate.save()
+        self.assertEqual(User.objects.get(pk=self.duplicate.pk).email_normalized, 'new@example.com')
+
+    def test_unchanged_email_is_claimed_once_free(self):
+        self.owner.delete()
+        self.duplicate.save(update_fields=['email'])
+        self.assertEqual(User.objects.get(pk=self.duplicate.pk).email_normalized, 'same@example.com')
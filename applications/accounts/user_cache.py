@@ -0,0 +1,60 @@
+# coding=utf-8
+
+"""
+Two-tier cache of authenticated User objects for `EmailAuthBackend.get_user`.
+
+Entries are keyed by user id and the shared per-user version of
+`applications.accounts.profile_cache`, which every save of the user (password
+changes and deactivation included) replaces, so the next request of that
+user reads the database again.
+"""
+
+import pickle
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from applications.accounts.profile_cache import PROFILE_CACHE_ENABLED, get_profile_version
+from utils.cache import TwoTierCache
+
+# Versions bumped by another process (a management command deactivating a user) must reach every worker,
+# so users are never cached over a per-process or dummy default cache, whatever the settings say.
+CROSS_PROCESS_CACHE = not any(name in settings.CACHES['default']['BACKEND'].lower() for name in ('locmem', 'dummy'))
+USER_CACHE_ENABLED = CROSS_PROCESS_CACHE and getattr(settings, 'USER_CACHE_ENABLED', PROFILE_CACHE_ENABLED)
+
+# Users are stored pickled: every request unpickles its own instance, so no two requests share one.
+user_objects = TwoTierCache('user', maxsize=getattr(settings, 'USER_CACHE_SIZE', 10000),
+                            ttl=getattr(settings, 'USER_CACHE_TTL', 600))
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def user_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_cached_user(user_id):
+    """ Returns the user with this primary key, raising `DoesNotExist` like `objects.get`. """
+    User = get_user_model()
+    if not USER_CACHE_ENABLED:
+        return User.objects.get(pk=user_id)
+
+    # The version is read before the row, so a row read before a write is never cached under its new version.
+    key = '%s:%s' % (user_id, get_profile_version(user_id))
+    data = user_objects.get(key)
+    if data is not None:
+        _count('hits')
+        return pickle.loads(data)
+
+    _count('misses')
+    user = User.objects.get(pk=user_id)
+    user_objects.set(key, pickle.dumps(user, pickle.HIGHEST_PROTOCOL))
+    return user
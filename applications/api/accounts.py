@@ -1,38 +1,68 @@
 # coding=utf-8
-import requests
 
-from django.contrib.auth import login, logout
-from django.contrib.auth import get_user_model
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model, login, logout
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.renderers import TemplateHTMLRenderer
 
+from applications.accounts.email_index import email_index
+from applications.accounts.export import USER_LIST_MAX_LIMIT, csv_lines, iter_export_rows, keyset_page, \
+    ndjson_lines
+from applications.accounts.fast_serializer import FAST_PROFILE_SERIALIZER, attach_relations, compile_serializer
 from applications.accounts.mixins import UserSocialRegisterMixin
-from utils.helpers import ErrorType
+from applications.accounts.outbox import enqueue_page_post
+from applications.accounts.registration import BULK_REGISTER_MAX_USERS, bulk_register
+from applications.accounts.profile_cache import bump_profile_version, get_cached_profile, get_profile_version, \
+    profile_etag, PROFILE_CACHE_ENABLED
+from applications.accounts.user_cache import get_cached_user
+from utils.helpers import ErrorType, etag_matches
+from utils.instrumentation import timed
+from utils.tokens import REFRESH, InvalidToken, issue_token_pair, verify_token
 from applications.accounts.serializer import UserLoginSerializer, UserProfileSerializer,  UserEmailRegisterSerializer, \
-    UserProfileUpdateSerializer, FBProfileSerializer
+    UserProfileUpdateSerializer, FBProfileSerializer, SERIALIZER_FIELD_COSTS, format_field_costs, requested_fields, \
+    with_profile_relations
 
 from allauth.socialaccount.models import SocialLogin, SocialToken, SocialApp, SocialAccount
 
-FB_GRAPH_API_USER_DATA_URL = 'https://graph.facebook.com/me?fields=id,name&access_token='
-FB_GRAPH_API_USER_PAGE_URL = 'https://graph.facebook.com/902243799945542/feed?message='
+FB_GRAPH_API_USER_PAGE_ID = getattr(settings, 'FB_PAGE_ID', '902243799945542')
+
+
+def with_tokens(request, data):
+    """ Adds signed API tokens of the logged in user to a social login response. """
+    if 'error' in data or not request.user.is_authenticated():
+        return data
+    # Coalesced logins share `data`, every request gets its own copy with its own tokens.
+    data = OrderedDict(data)
+    data.update(issue_token_pair(request.user))
+    return data
 
 
 class UpdateFbProfile(APIView, ErrorType):
 
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'profile_detail.html'
+    permission_classes = (IsAuthenticated,)
 
     def get(self, request):
         serializer = FBProfileSerializer()
-        return Response({'serializer': serializer})
+        data = {'serializer': serializer}
+        if request.user.is_authenticated():
+            # The unbound form is cached per user until the profile changes, bound forms show errors.
+            data.update(cache_form=True, profile_version=get_profile_version(request.user.pk))
+        return Response(data)
 
     def post(self, request):
-        import ipdb; ipdb.set_trace();
-        serializer = FBProfileSerializer(data=request.data)
+        serializer = FBProfileSerializer(request.user, data=request.data)
         if not serializer.is_valid():
             return Response({'serializer': serializer})
 
@@ -45,18 +75,13 @@ class UpdateFbProfile(APIView, ErrorType):
 
         request_user_data = {'message': request_data.get('message')}
         # https: // www.facebook.com / Vellithira - 902243799945542 / posts /
-        url = FB_GRAPH_API_USER_PAGE_URL + "Hello World!!"
-        resp = requests.post(url=url)
-        fb_response = resp.json()
-
-        # url = FB_GRAPH_API_USER_DATA_URL+token
-        # resp = requests.get(url=url)
-        # fb_user_data = resp.json()
-        # request_user_data = {'first_name':request_data.get('fname'),'last_name':request_data.get('lname'),'email':request_data.get('email')}
-
-        # valid = all(item in fb_user_data.items() for item in request_user_data.items())
-        serializer.save()
-        return redirect('profile-list')
+        # The post is stored in the transaction of the profile update, a failed update publishes nothing.
+        with transaction.atomic():
+            serializer.save()
+            # Published asynchronously by the `publish_page_posts` command.
+            enqueue_page_post(user=request.user, page_id=FB_GRAPH_API_USER_PAGE_ID, message="Hello World!!",
+                              idempotency_key=request.META.get('HTTP_IDEMPOTENCY_KEY'))
+        return redirect('profile-detail')
 
 
 class UserEmailRegisterView(APIView, ErrorType, UserSocialRegisterMixin):
@@ -99,13 +124,49 @@ class UserEmailRegisterView(APIView, ErrorType, UserSocialRegisterMixin):
                     return Response(status=self.BAD_REQUEST, data=data)
                 return Response(data=data)
             else:
-                user = serializer.create(serializer.validated_data)
+                try:
+                    user = serializer.create(serializer.validated_data)
+                except ValidationError as e:
+                    return Response(e.detail, status=self.BAD_REQUEST)
                 return Response(data=UserProfileSerializer(instance=user).data)
                 # return Response(data={})
 
         return Response(serializer.errors, status=self.BAD_REQUEST)
 
 
+class BulkUserRegisterView(APIView, ErrorType):
+
+    """
+    Registers many email users in one request, for partners.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request, format=None):
+        """
+        Request Methods : [POST]
+        ---
+
+        parameters:
+            - name: users
+              type: array
+              description: fname, lname, phone, email and password of every user
+
+        responseMessages:
+            - code: 400
+              message: Bad Request
+        """
+        users = request.data.get('users')
+        if not isinstance(users, list) or not users:
+            return Response(status=self.BAD_REQUEST, data={'error': 'A non-empty list of users is required.'})
+        if len(users) > BULK_REGISTER_MAX_USERS:
+            return Response(status=self.BAD_REQUEST,
+                            data={'error': 'At most %d users per request.' % BULK_REGISTER_MAX_USERS})
+        results = bulk_register(users)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({'created': created, 'failed': len(results) - created, 'results': results})
+
+
 class UserLoginView(APIView, ErrorType):
     """
     Performs login action on given values for email and password.
@@ -135,6 +196,7 @@ class UserLoginView(APIView, ErrorType):
             user=serializer.validated_data['user']
             if user is not None and user.is_active:
                 login(request, user)
+                response.update(issue_token_pair(user))
                 return Response(response)
 
         return Response(serializer.errors, status=self.NOT_AUTHORIZED)
@@ -165,7 +227,7 @@ class UserLogoutView(APIView):
         return Response(response)
 
 
-class UserSessionStatusView(APIView):
+class UserSessionStatusView(APIView, ErrorType):
     """
     Validates a user session status.
 
@@ -181,10 +243,14 @@ class UserSessionStatusView(APIView):
             type: boolean
 
         """
-        return Response({"logged-in":request.user.is_authenticated()})
+        logged_in = request.user.is_authenticated()
+        headers = {'ETag': '"session-%d"' % logged_in, 'Cache-Control': 'private, no-cache'}
+        if etag_matches(request, headers['ETag']):
+            return Response(status=self.NOT_MODIFIED, headers=headers)
+        return Response({"logged-in":logged_in}, headers=headers)
 
 
-class UserProfileDetail(APIView):
+class UserProfileDetail(APIView, ErrorType):
     """
     Returns profile details of current user session in given request.
 
@@ -200,6 +266,15 @@ class UserProfileDetail(APIView):
 
         serializer: applications.accounts.serializer.UserProfileSerializer
 
+        parameters:
+            - name: fields
+              type: string
+              paramType: query
+              description: comma separated fields to return
+            - name: omit
+              type: string
+              paramType: query
+              description: comma separated fields to leave out
 
         responseMessages:
             - code: 400
@@ -207,8 +282,21 @@ class UserProfileDetail(APIView):
 
 
         """
-        data = self.serializer_class(request.user).data
-        return Response(data)
+        fields, omit = requested_fields(request)
+        if SERIALIZER_FIELD_COSTS:
+            # Measured on a fresh serialization, a cached payload has no cost to report.
+            serializer = self.serializer_class(request.user, fields=fields, omit=omit)
+            data = serializer.data
+            return Response(data, headers={'X-Field-Cost': format_field_costs(serializer.field_costs)})
+
+        # The ETag only needs the profile version: a 304 skips serialization and the SocialAccount queries.
+        version = get_profile_version(request.user.pk) if PROFILE_CACHE_ENABLED else None
+        etag = profile_etag(request.user, self.serializer_class, version=version, fields=fields, omit=omit)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'} if etag else {}
+        if etag_matches(request, etag):
+            return Response(status=self.NOT_MODIFIED, headers=headers)
+        data = get_cached_profile(request.user, self.serializer_class, version=version, fields=fields, omit=omit)
+        return Response(data, headers=headers)
 
     def post(self, request, format=None):
         """
@@ -296,6 +384,101 @@ class UserProfileDetail(APIView):
 #         return redirect('http://becoapp.in')
 
 
+class UserListView(APIView, ErrorType):
+    """
+    Lists users in id order for staff, one keyset page at a time.
+
+    Request Methods : [GET]
+    """
+
+    permission_classes = (IsAdminUser,)
+    serializer_class = UserProfileSerializer
+
+    def get(self, request, format=None):
+        """
+        ---
+
+        serializer: applications.accounts.serializer.UserProfileSerializer
+
+        parameters:
+            - name: cursor
+              type: integer
+              paramType: query
+              description: next_cursor of the previous page
+            - name: limit
+              type: integer
+              paramType: query
+            - name: fields
+              type: string
+              paramType: query
+
+        responseMessages:
+            - code: 400
+              message: Bad Request
+        """
+        try:
+            after = int(request.query_params.get('cursor', 0))
+            limit = min(int(request.query_params.get('limit', 100)), USER_LIST_MAX_LIMIT)
+        except ValueError:
+            return Response(status=self.BAD_REQUEST, data={'error': 'cursor and limit must be integers.'})
+        if limit < 1:
+            return Response(status=self.BAD_REQUEST, data={'error': 'limit must be positive.'})
+
+        serializer = self.serializer_class(context={'request': request})
+        if FAST_PROFILE_SERIALIZER:
+            rows, next_cursor = keyset_page(get_user_model().objects.values(), after, limit)
+            represent = compile_serializer(serializer, rows=True)
+            rows = attach_relations(rows, serializer.fields)
+            with timed('serializer'):
+                results = [represent(row) for row in rows]
+        else:
+            users, next_cursor = keyset_page(with_profile_relations(get_user_model().objects.all(),
+                                                                    serializer.fields), after, limit)
+            results = self.serializer_class(users, many=True, context={'request': request}).data
+        return Response({'results': results, 'next_cursor': next_cursor})
+
+
+class UserExportView(APIView, ErrorType):
+    """
+    Streams every user with linked providers and roles as NDJSON or CSV, for staff.
+
+    Request Methods : [GET]
+    """
+
+    permission_classes = (IsAdminUser,)
+    content_types = {'ndjson': ('application/x-ndjson', ndjson_lines), 'csv': ('text/csv', csv_lines)}
+
+    def get(self, request):
+        """
+        ---
+
+        parameters:
+            - name: output
+              type: string
+              paramType: query
+              description: ndjson (default) or csv
+            - name: cursor
+              type: integer
+              paramType: query
+              description: export users with a greater id only, to resume an export
+
+        responseMessages:
+            - code: 400
+              message: Bad Request
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.content_types:
+            return Response(status=self.BAD_REQUEST, data={'error': 'output must be ndjson or csv.'})
+        try:
+            after = int(request.query_params.get('cursor', 0))
+        except ValueError:
+            return Response(status=self.BAD_REQUEST, data={'error': 'cursor must be an integer.'})
+        content_type, lines = self.content_types[output]
+        response = StreamingHttpResponse(lines(iter_export_rows(after=after)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="users.%s"' % output
+        return response
+
+
 class CheckEmailView(APIView, ErrorType):
 
     """
@@ -318,9 +501,7 @@ class CheckEmailView(APIView, ErrorType):
         response = dict(status=False)
         email = request.data.get('email')
         if email:
-            User = get_user_model()
-            users = User.objects.filter(email=email)
-            response['status'] = True if users else False
+            response['status'] = email_index.exists(email)
             return Response(status=200, data=response)
         return Response(status=self.NOT_FOUND)
 
@@ -359,6 +540,7 @@ class FacebookLoginOrSignup(APIView, ErrorType, UserSocialRegisterMixin):
 
         account_exists,can_signup = self.validate_social_account(access_token=access_token, provider='facebook')
         data = self.facebook_signup(request, access_token) if account_exists else {"error": "User not registered."}
+        data = with_tokens(request, data)
 
         if not account_exists and can_signup:
             return Response(status=self.CONFLICT)
@@ -396,9 +578,9 @@ class GoogleLoginOrSignup(APIView, ErrorType, UserSocialRegisterMixin):
         if request.user.is_authenticated():
             logout(request)
 
-        self.validate_social_account(access_token=access_token, provider='google')
         account_exists, can_signup = self.validate_social_account(access_token=access_token, provider='google')
         data = self.google_signup(request, access_token) if account_exists else {"error": "User not registered."}
+        data = with_tokens(request, data)
 
         if not account_exists and can_signup:
             return Response(status=self.CONFLICT)
@@ -408,6 +590,64 @@ class GoogleLoginOrSignup(APIView, ErrorType, UserSocialRegisterMixin):
         return Response(status=self.SUCCESS, data=data)
 
 
+class TokenRefreshView(APIView, ErrorType):
+    """
+    Exchanges a refresh token for a new access and refresh token pair.
+    """
+
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        """
+        Request Methods : [POST]
+        ---
+
+        parameters:
+            - name: refresh_token
+              type: string
+
+        responseMessages:
+            - code: 401
+              message: Not authenticated
+        """
+        try:
+            claims = verify_token(request.data.get('refresh_token', ''), REFRESH)
+            user = get_cached_user(claims['u'])
+        except InvalidToken as e:
+            return Response(status=self.NOT_AUTHORIZED, data={'error': str(e)})
+        except get_user_model().DoesNotExist:
+            return Response(status=self.NOT_AUTHORIZED, data={'error': 'Invalid token.'})
+        # Revoked by `TokenRevokeView`, password changes and deactivation.
+        if not user.is_active or user.token_version != claims['v']:
+            return Response(status=self.NOT_AUTHORIZED, data={'error': 'Token has been revoked.'})
+        return Response(issue_token_pair(user))
+
+
+class TokenRevokeView(APIView, ErrorType):
+    """
+    Revokes every refresh token of the current user, access tokens expire on their own.
+    """
+
+    def post(self, request):
+        """
+        Request Methods : [POST]
+        ---
+
+        omit_serializer: true
+
+        responseMessages:
+            - code: 401
+              message: Not authenticated
+        """
+        if not request.user.is_authenticated():
+            return Response(status=self.NOT_AUTHORIZED)
+        get_user_model().objects.filter(pk=request.user.pk).update(token_version=F('token_version') + 1)
+        # `update` sends no post_save, the cached user still holds the old token version.
+        bump_profile_version(request.user.pk)
+        return Response(dict(status='success'))
+
+
 class SubscribeView(APIView, ErrorType):
     """
     Email subscriptions
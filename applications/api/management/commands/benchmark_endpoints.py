@@ -0,0 +1,66 @@
+# coding=utf-8
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from benchmarks.harness import BENCH_URLCONF, build_scenarios, run_benchmarks, seed_users
+from utils.fake_graph import FakeGraphAPI, FakeGraphServer
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the auth and profile endpoints on a seeded test database and writes '
+            'throughput, latency percentiles, SQL query and Graph call counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=10000,
+                            help='Number of seeded users (e.g. 10000, 100000, 1000000).')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients in wsgi mode.')
+        parser.add_argument('--seed-workers', type=int, default=1,
+                            help='Processes used to seed the database, see generate_users --workers.')
+        parser.add_argument('--mode', action='append', choices=['client', 'wsgi'],
+                            help='Run only through the test client or the WSGI server (default: both).')
+        parser.add_argument('--endpoint', action='append',
+                            help='Benchmark only this view (repeatable), e.g. UserProfileDetail.')
+        parser.add_argument('--graph-latency', default='lognormal:4,0.5',
+                            help='Latency distribution of the fake Graph API, see fake_graph_server --latency.')
+        parser.add_argument('--real-graph', action='store_true',
+                            help='Use the configured FB_GRAPH_API_URL instead of a fake Graph server.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded test database between runs.')
+        parser.add_argument('--output', default='bench_output.json', help='Path of the JSON report.')
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        names = [scenario.name for scenario in build_scenarios(scale, '')]
+        for name in options['endpoint'] or []:
+            if name not in names:
+                self.stderr.write('Unknown endpoint %s, choose from %s' % (name, ', '.join(names)))
+                return
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False,
+                                           keepdb=options['keepdb'])
+        graph = None
+        try:
+            graph_settings = {}
+            if not options['real_graph']:
+                graph = FakeGraphServer(FakeGraphAPI(fixture_users=scale, latency=options['graph_latency'],
+                                                     seed=0)).start()
+                graph_settings['FB_GRAPH_API_URL'] = graph.url
+            with override_settings(ROOT_URLCONF=BENCH_URLCONF, DEBUG=False, ALLOWED_HOSTS=['*'], **graph_settings):
+                seed_users(scale, workers=options['seed_workers'], stdout=self.stdout)
+                report = run_benchmarks(scale, options['requests'], options['concurrency'],
+                                        only=options['endpoint'], modes=options['mode'] or ('client', 'wsgi'),
+                                        stdout=self.stdout)
+        finally:
+            if graph:
+                graph.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write('Wrote %s' % options['output'])
@@ -0,0 +1,36 @@
+# coding=utf-8
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from applications.accounts import serializer as account_serializers
+from benchmarks.serializers import run_serializer_benchmark
+
+SERIALIZERS = ('UserProfileSerializer', 'UserProfileV2Serializer', 'UserProfileV3Serializer')
+
+
+class Command(BaseCommand):
+    help = ('Serializes in-memory users with a profile serializer and with its compiled representation, '
+            'and reports both durations and whether their JSON output is byte-identical.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Number of users serialized per run.')
+        parser.add_argument('--serializer', default='UserProfileSerializer', choices=SERIALIZERS,
+                            help='V2 and V3 need --omit checkins,points (V3 also stores), users have no such data.')
+        parser.add_argument('--fields', help='Comma separated field selection, like ?fields=.')
+        parser.add_argument('--omit', help='Comma separated omitted fields, like ?omit=.')
+        parser.add_argument('--rounds', type=int, default=3, help='Runs per variant, the fastest is reported.')
+        parser.add_argument('--output', help='Also write the report as JSON to this path.')
+
+    def handle(self, *args, **options):
+        selection = dict((name, tuple(options[name].split(',')) if options[name] else None)
+                         for name in ('fields', 'omit'))
+        report = run_serializer_benchmark(getattr(account_serializers, options['serializer']),
+                                          count=options['count'], rounds=options['rounds'], **selection)
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+        if not (report['identical'] and report['identical_rows']):
+            self.stderr.write('Compiled output differs from the DRF serializer output.')
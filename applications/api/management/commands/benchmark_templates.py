@@ -0,0 +1,27 @@
+# coding=utf-8
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.templates import TEMPLATE_NAMES, run_template_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Renders the HTML templates with the source loaders, with the cached loader, and with the cached '
+            'loader plus fragment caching, and reports the microseconds per render of each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', action='append', help='Template to render (repeatable), '
+                                                                'default: %s.' % ', '.join(TEMPLATE_NAMES))
+        parser.add_argument('--count', type=int, default=200, help='Renders per run.')
+        parser.add_argument('--rounds', type=int, default=3, help='Runs per variant, the fastest is reported.')
+        parser.add_argument('--output', help='Also write the report as JSON to this path.')
+
+    def handle(self, *args, **options):
+        report = run_template_benchmark(options['template'] or TEMPLATE_NAMES, count=options['count'],
+                                        rounds=options['rounds'])
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
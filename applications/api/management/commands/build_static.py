@@ -0,0 +1,40 @@
+# coding=utf-8
+
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from utils.assets import page_report
+
+
+def kilobytes(size):
+    return '%.1f' % (size / 1024.0)
+
+
+class Command(BaseCommand):
+    help = ('Collects the pruned static files into STATIC_ROOT, fingerprinted and with gzip and Brotli variants, '
+            'then reports the kilobytes the local assets of every template page transfer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-collect', action='store_false', dest='collect',
+                            help='Only report on the files already in STATIC_ROOT.')
+        parser.add_argument('--output', help='Also write the report as JSON to this path.')
+
+    def handle(self, *args, **options):
+        if options['collect']:
+            call_command('collectstatic', interactive=False, clear=True, verbosity=options['verbosity'])
+        report = page_report()
+        self.stdout.write('%-24s %6s %10s %10s %10s' % ('page', 'assets', 'raw KB', 'gzip KB', 'br KB'))
+        for page, row in report.items():
+            self.stdout.write('%-24s %6d %10s %10s %10s' % (page, row['assets'], kilobytes(row['identity']),
+                                                            kilobytes(row['gzip']), kilobytes(row['br'])))
+        for page, row in report.items():
+            if row['missing']:
+                self.stderr.write('%s references files not in STATIC_ROOT: %s' % (page, ', '.join(row['missing'])))
+            if row['unversioned']:
+                self.stderr.write('%s links %d assets without the static tag, they are neither fingerprinted '
+                                  'nor cached as immutable.' % (page, len(row['unversioned'])))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
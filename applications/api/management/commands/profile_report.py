@@ -0,0 +1,48 @@
+# coding=utf-8
+
+import os
+import pstats
+
+from django.core.management.base import BaseCommand
+
+from utils.profiling import PROFILING_DIR, profile_paths
+
+# Indexes in the report rows: `(calls, primitive calls, tottime, cumtime, function)`.
+SORT_COLUMNS = {'calls': 0, 'tottime': 2, 'cumtime': 3}
+
+
+class Command(BaseCommand):
+    help = ('Aggregates the request profiles written by ProfilingMiddleware per view and prints the hottest '
+            'functions of each view.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=PROFILING_DIR, help='Profile directory (default: PROFILING_DIR).')
+        parser.add_argument('--view', action='append', help='Report only this view (repeatable).')
+        parser.add_argument('--sort', default='tottime', choices=sorted(SORT_COLUMNS),
+                            help='tottime: time in the function itself, cumtime: including callees.')
+        parser.add_argument('--limit', type=int, default=25, help='Functions listed per view.')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['dir']):
+            self.stderr.write('No profiles in %s' % options['dir'])
+            return
+        views = options['view'] or sorted(os.listdir(options['dir']))
+        for view in views:
+            directory = os.path.join(options['dir'], view)
+            paths = profile_paths(directory) if os.path.isdir(directory) else []
+            if not paths:
+                self.stderr.write('No profiles of %s' % view)
+                continue
+            self.report(view, pstats.Stats(*paths), len(paths), options['sort'], options['limit'])
+
+    def report(self, view, stats, requests, sort, limit):
+        column = SORT_COLUMNS[sort]
+        rows = sorted(((values[1], values[0], values[2], values[3], func) for func, values in stats.stats.items()),
+                      key=lambda row: row[column], reverse=True)
+        self.stdout.write('\n%s: %d requests, %.1f ms per request' % (
+            view, requests, stats.total_tt * 1000 / requests))
+        self.stdout.write('%10s %12s %12s %12s  %s' % ('calls', 'tottime ms', 'cumtime ms', 'per request', 'function'))
+        for calls, primitive_calls, tottime, cumtime, (filename, line, name) in rows[:limit]:
+            per_request = (cumtime if sort == 'cumtime' else tottime) * 1000 / requests
+            self.stdout.write('%10d %12.2f %12.2f %12.3f  %s:%d(%s)' % (
+                calls, tottime * 1000, cumtime * 1000, per_request, filename, line, name))
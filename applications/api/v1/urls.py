@@ -15,6 +15,7 @@ urlpatterns = [
     url(r'^login/$', TemplateView.as_view(template_name="login.html"), name='user-login'),
     # url(r'^login/$', account_view.UserLoginView.as_view(), name='user-login'),
     url(r'^register/$', account_view.UserEmailRegisterView.as_view(), name='user-email-register'),
+    url(r'^register/bulk/$', account_view.BulkUserRegisterView.as_view(), name='user-bulk-register'),
     # url(r'^logout/$', check_authorized(account_view.UserLogoutView.as_view()), name='user-logout'),
     # url(r'^session-status/$', account_view.UserSessionStatusView.as_view(), name='user-session-status'),
     # url(r'^check-email/$', account_view.CheckEmailView.as_view(), name='check-email'),
@@ -23,5 +24,9 @@ urlpatterns = [
     # url(r'^update-password/$', account_view.PasswordUpateView.as_view(), name='user-password-update'),
     url(r'^login/facebook/$', account_view.FacebookLoginOrSignup.as_view(), name='user-facebook-login-signup'),
     url(r'^login/google/$', account_view.GoogleLoginOrSignup.as_view(), name='user-google-login-signup'),
+    url(r'^users/$', account_view.UserListView.as_view(), name='user-list'),
+    url(r'^users/export/$', account_view.UserExportView.as_view(), name='user-export'),
+    url(r'^token/refresh/$', account_view.TokenRefreshView.as_view(), name='token-refresh'),
+    url(r'^token/revoke/$', account_view.TokenRevokeView.as_view(), name='token-revoke'),
     # url(r'^subscribe/(?P<email_id>[\w.%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,4})/$', account_view.SubscribeView.as_view(), name="email-subscription"),
 ]
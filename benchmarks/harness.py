@@ -0,0 +1,237 @@
+# coding=utf-8
+
+"""
+Endpoint benchmark harness.
+
+Seeds users matching the fake Graph fixture users (user n answers to the
+token `fake-token-<n>`), then runs every scenario through the Django test
+client (reporting SQL queries per request) and through a threaded WSGI
+server with concurrent clients. Results are plain dicts, dumped as JSON by
+the `benchmark_endpoints` command so runs of two commits can be compared.
+"""
+
+import itertools
+import json
+import platform
+import subprocess
+import threading
+import time
+import uuid
+
+import django
+import requests
+from allauth.socialaccount.models import SocialAccount
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.six.moves import range
+
+from applications.accounts.generator import generate_users, next_user_number
+from utils.fake_graph import FakeGraphServer, fixture_token, fixture_user
+from utils.graph import get_graph_client
+
+BENCH_URLCONF = 'benchmarks.urls'
+BENCH_PASSWORD = 'bench-password'
+
+
+class Scenario(object):
+    """
+    A benchmarked endpoint: `payload(i)` builds the JSON body of request `i`,
+    `authenticated` scenarios run with the session of a seeded user.
+    """
+
+    def __init__(self, name, method, path, payload=None, authenticated=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.authenticated = authenticated
+
+    def body(self, i):
+        return json.dumps(self.payload(i)) if self.payload else None
+
+
+def build_scenarios(scale, run_id, emails=None):
+    emails = emails or ['nobody@example.com']
+    return [
+        Scenario('UserEmailRegisterView', 'POST', '/register/', lambda i: {
+            'fname': 'Bench', 'lname': 'Register', 'password': BENCH_PASSWORD,
+            'email': 'bench.%s.%d@example.com' % (run_id, i)}),
+        Scenario('FacebookLoginOrSignup', 'POST', '/login/facebook/',
+                 lambda i: {'access_token': fixture_token(i % scale)}),
+        Scenario('GoogleLoginOrSignup', 'POST', '/login/google/',
+                 lambda i: {'access_token': fixture_token(i % scale)}),
+        Scenario('UserProfileDetail', 'GET', '/profile/', authenticated=True),
+        Scenario('CheckEmailView', 'POST', '/check-email/', lambda i: {'email': emails[i % len(emails)]}),
+    ]
+
+
+def seed_users(scale, chunk_size=5000, workers=1, stdout=None):
+    """
+    Generates users up to user number `scale` (resuming a kept database), each
+    with a Facebook SocialAccount matching the fake Graph fixture user.
+    """
+    start = next_user_number()
+    if start >= scale:
+        return
+
+    def progress(created, count):
+        if stdout:
+            stdout.write('seeded %d/%d users' % (start + created, scale))
+
+    generate_users(scale - start, start=start, chunk_size=chunk_size, workers=workers,
+                   password=BENCH_PASSWORD, progress=progress)
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not values:
+        return None
+    index = max(int(round(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(latencies, elapsed, statuses):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': dict(('p%s' % pct, round(percentile(latencies, pct) * 1000.0, 3))
+                           for pct in (50, 90, 99)) if latencies else {},
+        'max_ms': round(latencies[-1] * 1000.0, 3) if latencies else None,
+        'statuses': statuses,
+    }
+
+
+def graph_calls():
+    return sum(stats['calls'] for stats in get_graph_client().stats.snapshot().values())
+
+
+def _count_status(statuses, status):
+    key = str(status)
+    statuses[key] = statuses.get(key, 0) + 1
+
+
+def run_client(scenario, requests_count, session_user):
+    """ Runs a scenario sequentially through the Django test client, counting SQL queries. """
+    client = Client()
+    if scenario.authenticated:
+        client.force_login(session_user, backend='applications.accounts.backend.EmailAuthBackend')
+    latencies, queries, statuses = [], 0, {}
+    graph_before = graph_calls()
+    started = time.time()
+    for i in range(requests_count):
+        body = scenario.body(i)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.time()
+            if scenario.method == 'GET':
+                response = client.get(scenario.path)
+            else:
+                response = client.post(scenario.path, data=body, content_type='application/json')
+            latencies.append(time.time() - start)
+        queries += len(captured)
+        _count_status(statuses, response.status_code)
+    result = summarize(latencies, time.time() - started, statuses)
+    result['sql_queries_per_request'] = round(queries / float(requests_count), 2)
+    result['graph_calls_per_request'] = round((graph_calls() - graph_before) / float(requests_count), 2)
+    return result
+
+
+class BenchWSGIServer(FakeGraphServer):
+    """ Serves the Django application on a background thread. """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super(BenchWSGIServer, self).__init__(WSGIHandler(), host=host, port=port)
+
+
+def run_wsgi(scenario, requests_count, concurrency, base_url, session_cookie):
+    """ Runs a scenario against a WSGI server with `concurrency` client threads. """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+
+    def worker():
+        session = requests.Session()
+        if scenario.authenticated:
+            session.cookies.set(settings.SESSION_COOKIE_NAME, session_cookie)
+        while True:
+            i = next(counter)
+            if i >= requests_count:
+                return
+            start = time.time()
+            response = session.request(scenario.method, base_url + scenario.path, data=scenario.body(i),
+                                       headers={'Content-Type': 'application/json'})
+            elapsed = time.time() - start
+            with lock:
+                latencies.append(elapsed)
+                _count_status(statuses, response.status_code)
+
+    graph_before = graph_calls()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.time() - started, statuses)
+    result['concurrency'] = concurrency
+    result['graph_calls_per_request'] = round((graph_calls() - graph_before) / float(requests_count), 2)
+    return result
+
+
+def session_cookie_for(user):
+    client = Client()
+    client.force_login(user, backend='applications.accounts.backend.EmailAuthBackend')
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR).strip().decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale, requests_count, concurrency, only=None, modes=('client', 'wsgi'), stdout=None):
+    """ Runs the selected scenarios in the selected modes and returns the JSON-serializable report. """
+    run_id = uuid.uuid4().hex[:8]
+    session_user = SocialAccount.objects.select_related('user').get(provider='facebook',
+                                                                     uid=fixture_user(0)['id']).user
+    # Half of the checked emails exist, as in production most checks are for unknown addresses.
+    emails = [email for pair in zip(SocialAccount.objects.filter(provider='facebook').order_by('id')
+                                    .values_list('user__email', flat=True)[:500],
+                                    ['unknown.%d@example.com' % i for i in range(500)]) for email in pair]
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.time(),
+            'scale': scale,
+            'requests': requests_count,
+            'concurrency': concurrency,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'graph_api_url': getattr(settings, 'FB_GRAPH_API_URL', None),
+        },
+        'results': {},
+    }
+
+    server = BenchWSGIServer().start() if 'wsgi' in modes else None
+    try:
+        cookie = session_cookie_for(session_user) if server else None
+        for scenario in build_scenarios(scale, run_id, emails):
+            if only and scenario.name not in only:
+                continue
+            result = report['results'][scenario.name] = {}
+            if 'client' in modes:
+                result['client'] = run_client(scenario, requests_count, session_user)
+            if server:
+                result['wsgi'] = run_wsgi(scenario, requests_count, concurrency, server.url, cookie)
+            if stdout:
+                stdout.write('%s: %s' % (scenario.name, json.dumps(result, sort_keys=True)))
+    finally:
+        if server:
+            server.stop()
+    return report
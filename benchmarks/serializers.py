@@ -0,0 +1,89 @@
+# coding=utf-8
+
+"""
+Serialization benchmark of the profile serializers.
+
+Serializes in-memory users (no database needed) with the DRF serializer,
+the compiled serializer on model instances and the compiled serializer on
+`values()`-like rows, and checks that all three render the same JSON bytes.
+"""
+
+import datetime
+import time
+
+from allauth.socialaccount.models import SocialAccount
+from django.utils.six.moves import range
+from rest_framework.renderers import JSONRenderer
+
+from applications.accounts.fast_serializer import compile_serializer
+from applications.accounts.models import User, UserRoles
+from utils.constants import USER_ROLES
+from utils.helpers import UtlRandom
+
+
+def build_users(count, seed=0):
+    """ Returns `count` unsaved users with prefetched social accounts and roles, so serialization runs no query. """
+    rnd = UtlRandom(seed=seed)
+    users = []
+    for n in range(count):
+        role = USER_ROLES[rnd.random_num(0, len(USER_ROLES) - 1)][0]
+        user = User(id=n + 1, first_name=rnd.random_username(6).capitalize(),
+                    last_name=rnd.random_username(8).capitalize(), email='%s.%d@example.com' % (
+                        rnd.random_username(8), n), role=role, gender=('male', 'female', None)[n % 3],
+                    mobile='9' + rnd.random_digits(9) if n % 4 else None,
+                    dob=datetime.date(1950, 1, 1) + datetime.timedelta(days=rnd.random_num(0, 20000)),
+                    profile_image_url='https://example.com/%d.png' % n if n % 2 else None)
+        user.prefetched_social_accounts = [SocialAccount(provider='facebook')] + \
+            ([SocialAccount(provider='google')] if n % 3 == 0 else [])
+        user.prefetched_roles = [UserRoles(name=role)]
+        users.append(user)
+    return users
+
+
+def build_rows(users):
+    """ Returns the rows `profile_rows` would read for `users`. """
+    rows = []
+    for user in users:
+        row = dict((field.attname, getattr(user, field.attname)) for field in User._meta.concrete_fields)
+        row['oauth_providers'] = set(account.provider for account in user.prefetched_social_accounts)
+        row['role_names'] = [role.name for role in user.prefetched_roles]
+        rows.append(row)
+    return rows
+
+
+def best_time(fn, rounds):
+    """ Returns the result of `fn()` and its fastest duration in milliseconds over `rounds` runs. """
+    best, result = None, None
+    for _ in range(rounds):
+        started = time.time()
+        result = fn()
+        elapsed = (time.time() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run_serializer_benchmark(serializer_class, count=10000, fields=None, omit=None, rounds=3):
+    users = build_users(count)
+    rows = build_rows(users)
+    serializer = serializer_class(fields=fields, omit=omit)
+    represent = compile_serializer(serializer)
+    represent_row = compile_serializer(serializer, rows=True)
+
+    drf, drf_ms = best_time(lambda: serializer_class(users, many=True, fields=fields, omit=omit).data, rounds)
+    compiled, compiled_ms = best_time(lambda: [represent(user) for user in users], rounds)
+    compiled_rows, compiled_rows_ms = best_time(lambda: [represent_row(row) for row in rows], rounds)
+
+    renderer = JSONRenderer()
+    expected = renderer.render(drf)
+    return {
+        'serializer': serializer_class.__name__,
+        'fields': list(serializer.fields),
+        'count': count,
+        'drf_ms': round(drf_ms, 2),
+        'compiled_ms': round(compiled_ms, 2),
+        'compiled_rows_ms': round(compiled_rows_ms, 2),
+        'speedup': round(drf_ms / compiled_ms, 2) if compiled_ms else None,
+        'speedup_rows': round(drf_ms / compiled_rows_ms, 2) if compiled_rows_ms else None,
+        'identical': renderer.render(compiled) == expected,
+        'identical_rows': renderer.render(compiled_rows) == expected,
+    }
@@ -0,0 +1,73 @@
+# coding=utf-8
+
+"""
+Render time benchmark of the HTML templates.
+
+Renders every template for an in-memory user with the source loaders
+alone (templates read and parsed on every render, as with DEBUG), with the
+cached loader, and with the cached loader plus the per-user fragment
+caches of the templates, warmed by a first render.
+"""
+
+import copy
+from collections import OrderedDict
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils.six.moves import range
+
+from applications.accounts.profile_cache import get_profile_version
+from applications.accounts.serializer import FBProfileSerializer
+from benchmarks.serializers import best_time, build_users
+
+TEMPLATE_NAMES = ('index.html', 'login.html', 'profile_detail.html', 'forms.html', 'buttons.html')
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+
+# `(name, cached loader, fragment caches)`
+VARIANTS = (
+    ('uncached', False, False),
+    ('cached_loader', True, False),
+    ('cached_loader_fragments', True, True),
+)
+
+
+def templates_setting(cached):
+    """ Returns the TEMPLATES setting with the source loaders, wrapped in the cached loader when `cached`. """
+    templates = copy.deepcopy(settings.TEMPLATES)
+    for config in templates:
+        loaders = config['OPTIONS']['loaders']
+        if isinstance(loaders[0], (list, tuple)) and loaders[0][0] == CACHED_LOADER:
+            loaders = list(loaders[0][1])
+        config['OPTIONS']['loaders'] = [(CACHED_LOADER, loaders)] if cached else loaders
+    return templates
+
+
+def render_context(user, fragments):
+    """ The context `UpdateFbProfile.get` renders with, the other templates ignore it. """
+    context = {'serializer': FBProfileSerializer()}
+    if fragments:
+        context.update(cache_form=True, profile_version=get_profile_version(user.pk))
+    return context
+
+
+def run_template_benchmark(names=TEMPLATE_NAMES, count=200, rounds=3):
+    user = build_users(1)[0]
+    request = RequestFactory().get('/api/v1/account/')
+    request.user = user
+
+    report = OrderedDict((name, OrderedDict()) for name in names)
+    for variant, cached, fragments in VARIANTS:
+        with override_settings(TEMPLATES=templates_setting(cached)):
+            for name in names:
+                def render(name=name, fragments=fragments):
+                    return render_to_string(name, render_context(user, fragments), request=request)
+
+                report[name]['bytes'] = len(render())
+                _, ms = best_time(lambda: [render() for _ in range(count)], rounds)
+                report[name]['%s_us' % variant] = round(ms * 1000 / count, 1)
+    for timings in report.values():
+        fastest = timings['cached_loader_fragments_us']
+        timings['speedup'] = round(timings['uncached_us'] / fastest, 2) if fastest else None
+    return report
@@ -0,0 +1,13 @@
+from django.conf.urls import url
+
+from applications.api import accounts as account_view
+
+# Routes every benchmarked view, including the ones not (yet) exposed in applications.api.v1.urls.
+urlpatterns = [
+    url(r'^register/$', account_view.UserEmailRegisterView.as_view(), name='bench-register'),
+    url(r'^login/$', account_view.UserLoginView.as_view(), name='bench-login'),
+    url(r'^login/facebook/$', account_view.FacebookLoginOrSignup.as_view(), name='bench-login-facebook'),
+    url(r'^login/google/$', account_view.GoogleLoginOrSignup.as_view(), name='bench-login-google'),
+    url(r'^profile/$', account_view.UserProfileDetail.as_view(), name='bench-profile'),
+    url(r'^check-email/$', account_view.CheckEmailView.as_view(), name='bench-check-email'),
+]
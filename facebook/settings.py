@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'utils.metrics.MetricsMiddleware',
+    'utils.instrumentation.InstrumentationMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -55,6 +57,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'facebook.urls'
@@ -63,7 +66,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': ['templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -71,10 +73,20 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ],
         },
     },
 ]
 
+# Production parses every template once per process, set CACHED_TEMPLATES=0 to re-read edited templates per request
+if os.environ.get('CACHED_TEMPLATES', '0' if DEBUG else '1') == '1':
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', TEMPLATES[0]['OPTIONS']['loaders']),
+    ]
+
 WSGI_APPLICATION = 'facebook.wsgi.application'
 
 
@@ -88,6 +100,15 @@ DATABASES = {
     }
 }
 
+# Shared cache backing the profile, token and user caches.
+# Use memcached (or another cross-process backend) in production, LocMemCache is per worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -136,7 +157,13 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static")
 ]
 
+STATICFILES_FINDERS = [
+    'utils.assets.PrunedFileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+]
 
+# Writes fingerprinted files plus gzip and, with brotlipy installed, Brotli variants,
+# served with far-future immutable Cache-Control headers.
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 REST_FRAMEWORK = {
@@ -147,6 +174,7 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'utils.authentication.SignedTokenAuthentication',
         'utils.csrf.UnsafeSessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -174,3 +202,120 @@ SOCIALACCOUNT_PROVIDERS = {
     }
 }
 
+
+# Facebook Graph API client (utils.graph)
+# Point FB_GRAPH_API_URL at `manage.py fake_graph_server` to load test without graph.facebook.com.
+FB_GRAPH_API_URL = os.environ.get('FB_GRAPH_API_URL', 'https://graph.facebook.com')
+FB_GRAPH_POOL_SIZE = 10
+FB_GRAPH_CONNECT_TIMEOUT = 3.05
+FB_GRAPH_READ_TIMEOUT = 10
+FB_GRAPH_MAX_RETRIES = 2
+FB_GRAPH_RETRY_BACKOFF = 0.2
+
+# Verified Facebook access token cache (in-process LRU plus the default Django cache)
+FB_TOKEN_CACHE_SIZE = 10000
+FB_TOKEN_CACHE_TTL = 300
+FB_TOKEN_CACHE_SHARED = True
+
+# Facebook page post outbox (applications.accounts.outbox, `manage.py publish_page_posts`)
+FB_PAGE_ID = os.environ.get('FB_PAGE_ID', '902243799945542')
+FB_PAGE_ACCESS_TOKEN = os.environ.get('FB_PAGE_ACCESS_TOKEN', '')
+FB_PAGE_POST_MAX_ATTEMPTS = 5
+FB_PAGE_POST_RETRY_BACKOFF = 30
+
+# Versioned profile payload cache (applications.accounts.profile_cache)
+# Profile versions must be seen by every process writing users, management commands and the worker dyno
+# included, so the cache is off with LocMemCache. Set CACHE_BACKEND to a shared backend such as
+# django.core.cache.backends.memcached.PyLibMCCache with CACHE_LOCATION, or PROFILE_CACHE_ENABLED=1 to try it
+# under runserver while nothing else writes.
+PROFILE_CACHE_ENABLED = os.environ.get(
+    'PROFILE_CACHE_ENABLED', '0' if 'locmem' in CACHES['default']['BACKEND'].lower() else '1') == '1'
+PROFILE_CACHE_TTL = 600
+PROFILE_CACHE_SIZE = 10000
+
+# Registered email Bloom filter (applications.accounts.email_index)
+EMAIL_BLOOM_ERROR_RATE = 0.01
+EMAIL_BLOOM_MIN_CAPACITY = 100000
+EMAIL_BLOOM_SYNC_INTERVAL = 1
+EMAIL_BLOOM_REBUILD_INTERVAL = 3600
+
+# Authenticated user object cache (applications.accounts.user_cache), only with a cross-process CACHE_BACKEND
+USER_CACHE_TTL = 600
+USER_CACHE_SIZE = 10000
+
+# Signed API tokens (utils.tokens)
+ACCESS_TOKEN_TTL = 5 * 60
+REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60
+
+# Password hashing (utils.passwords) and bulk registration (applications.accounts.registration)
+PASSWORD_HASH_CONCURRENCY = int(os.environ['PASSWORD_HASH_CONCURRENCY']) \
+    if os.environ.get('PASSWORD_HASH_CONCURRENCY') else None
+# Hashing pool processes per process, web workers hash inline unless set.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '0'))
+BULK_REGISTER_MAX_USERS = 1000
+
+# Per-field serializer query cost headers (applications.accounts.serializer)
+SERIALIZER_FIELD_COSTS = os.environ.get('SERIALIZER_FIELD_COSTS', '') == '1'
+
+# Compiled profile representations (applications.accounts.fast_serializer)
+FAST_PROFILE_SERIALIZER = True
+
+# Staff user listing and export (applications.accounts.export)
+USER_LIST_MAX_LIMIT = 500
+USER_EXPORT_BATCH_SIZE = 2000
+
+# Sampled request instrumentation (utils.instrumentation)
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.01'))
+INSTRUMENTATION_TRACE_HEADER = DEBUG
+
+PASSWORD_HASHERS = [
+    'utils.instrumentation.TimedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+    'django.contrib.auth.hashers.SHA1PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.CryptPasswordHasher',
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Prometheus metrics (utils.metrics), METRICS_DIR is shared by the gunicorn workers
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN') or None
+# `/metrics` is a 404 unless METRICS_AUTH_TOKEN or the scraper addresses are set, e.g. `10.0.0.5,10.0.0.6`.
+METRICS_ALLOWED_IPS = tuple(ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip())
+
+# Request profiling (utils.profiling), profile on demand with `X-Profile: <PROFILING_TOKEN>`
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '50'))
+
+# Static file pruning (utils.assets), only referenced vendor files are collected,
+# plus the plugins, skins and languages the editors load at runtime
+STATIC_PRUNE_PREFIXES = ('vendors/',)
+STATIC_KEEP_PATTERNS = (
+    'vendors/ckeditor/config.js',
+    'vendors/ckeditor/contents.css',
+    'vendors/ckeditor/styles.js',
+    'vendors/ckeditor/lang/*',
+    'vendors/ckeditor/plugins/*',
+    'vendors/ckeditor/skins/*',
+    'vendors/tinymce/js/tinymce/*',
+)
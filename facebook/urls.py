@@ -1,8 +1,11 @@
 from django.conf.urls import include, url
 from django.contrib import admin
 
+from utils.metrics import metrics_view
+
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^api/v1/', include('applications.api.v1.urls')),
     url(r'^social-accounts/', include('allauth.urls')),
+    url(r'^metrics$', metrics_view, name='metrics'),
 ]
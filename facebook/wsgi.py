@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "facebook.settings")
 
 application = get_wsgi_application()
+
+# Registered email checks use the Bloom filter once this background build completes.
+from applications.accounts.email_index import email_index  # noqa: E402, needs the app registry
+
+email_index.warm()
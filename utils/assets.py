@@ -0,0 +1,184 @@
+# coding=utf-8
+
+"""
+Pruning of the deployable static files.
+
+The theme ships whole vendor packages (docs, samples, test suites) under
+`static/vendors/`, of which the templates use a fraction. `PrunedFileSystemFinder`
+only finds the files of `STATIC_PRUNE_PREFIXES` that a template references,
+directly or through the `url()` and `@import` of a referenced stylesheet,
+or that match `STATIC_KEEP_PATTERNS` (files loaded at runtime by a script).
+`collectstatic` then copies, fingerprints and compresses the pruned set only,
+and `page_report` tells what each page costs over the wire once collected.
+"""
+
+import fnmatch
+import io
+import os
+import posixpath
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import FileSystemFinder
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+STATIC_PRUNE_PREFIXES = getattr(settings, 'STATIC_PRUNE_PREFIXES', ('vendors/',))
+STATIC_KEEP_PATTERNS = getattr(settings, 'STATIC_KEEP_PATTERNS', ())
+
+STATIC_TAG_RE = re.compile(r"""{%\s*static\s+['"]([^'"]+)['"]\s*%}""")
+# Assets linked relatively to the static root without the tag, as in `src="vendors/flot/jquery.flot.js"`,
+# are reported as unversioned by `page_report`.
+RELATIVE_REFERENCE_RE = re.compile(r"""(?:src|href)\s*=\s*['"]([^'"{}#:]+)['"]""")
+CSS_REFERENCE_RE = re.compile(r"""url\(\s*['"]?([^'")]+?)['"]?\s*\)|@import\s+['"]([^'"]+)['"]""")
+
+
+def _clean(reference):
+    reference = reference.split('?')[0].split('#')[0].strip()
+    if not reference or reference.startswith(('//', 'data:')) or ':' in reference:
+        return None
+    return posixpath.normpath(reference.lstrip('/'))
+
+
+def template_dirs():
+    return [directory for config in settings.TEMPLATES for directory in config.get('DIRS', [])]
+
+
+def template_references(directories=None):
+    """
+    Returns `{template name: [(static name, via static tag)]}` for the
+    templates of `directories`, in order of appearance.
+    """
+    pages = OrderedDict()
+    for directory in directories or template_dirs():
+        for root, dirs, files in os.walk(directory):
+            for filename in sorted(files):
+                if not filename.endswith('.html'):
+                    continue
+                path = os.path.join(root, filename)
+                with io.open(path, encoding='utf-8', errors='replace') as template:
+                    source = template.read()
+                references = OrderedDict()
+                for match in STATIC_TAG_RE.finditer(source):
+                    # Directory URLs, such as an editor's base path, are not files.
+                    if not match.group(1).endswith('/'):
+                        references.setdefault(_clean(match.group(1)), True)
+                for match in RELATIVE_REFERENCE_RE.finditer(source):
+                    name = _clean(match.group(1))
+                    if name and not name.endswith('.html'):
+                        references.setdefault(name, False)
+                pages[os.path.relpath(path, directory)] = [(name, tag) for name, tag in references.items() if name]
+    return pages
+
+
+def css_references(name, source):
+    """ Returns the static names referenced by the stylesheet `name`. """
+    names = []
+    for match in CSS_REFERENCE_RE.finditer(source):
+        reference = _clean(match.group(1) or match.group(2))
+        if reference:
+            names.append(posixpath.normpath(posixpath.join(posixpath.dirname(name), reference)))
+    return names
+
+
+def is_pruned(name):
+    return name.startswith(tuple(STATIC_PRUNE_PREFIXES)) and \
+        not any(fnmatch.fnmatch(name, pattern) for pattern in STATIC_KEEP_PATTERNS)
+
+
+class PrunedFileSystemFinder(FileSystemFinder):
+    """ `FileSystemFinder` leaving out the files of `STATIC_PRUNE_PREFIXES` no template uses. """
+
+    _referenced = None
+
+    def source_path(self, name):
+        for prefix, root in self.locations:
+            if prefix:
+                if not name.startswith(prefix + '/'):
+                    continue
+                name = name[len(prefix) + 1:]
+            path = os.path.join(root, *name.split('/'))
+            if os.path.isfile(path):
+                return path
+        return None
+
+    @property
+    def referenced(self):
+        """ The static names used by the templates and by the stylesheets they use, recursively. """
+        if self._referenced is None:
+            pending = [name for references in template_references().values() for name, tag in references]
+            referenced = set()
+            while pending:
+                name = pending.pop()
+                if name in referenced:
+                    continue
+                referenced.add(name)
+                path = self.source_path(name)
+                if path and name.endswith('.css'):
+                    with io.open(path, encoding='utf-8', errors='replace') as stylesheet:
+                        pending.extend(css_references(name, stylesheet.read()))
+            self._referenced = referenced
+        return self._referenced
+
+    def keep(self, name):
+        return not is_pruned(name) or name in self.referenced
+
+    def find(self, path, all=False):
+        if not self.keep(path.replace(os.sep, '/')):
+            return []
+        return super(PrunedFileSystemFinder, self).find(path, all)
+
+    def list(self, ignore_patterns):
+        for path, storage in super(PrunedFileSystemFinder, self).list(ignore_patterns):
+            name = path.replace(os.sep, '/')
+            if storage.prefix:
+                name = '%s/%s' % (storage.prefix, name)
+            if self.keep(name):
+                yield path, storage
+
+
+def collected_sizes(name, storage=None):
+    """
+    Returns the `{encoding: bytes}` of the collected file of a static name,
+    `identity` plus `gzip` and `br` when compressed variants were written,
+    or None when the file was not collected.
+    """
+    storage = storage or staticfiles_storage
+    try:
+        stored = storage.stored_name(name) if hasattr(storage, 'stored_name') else name
+    except ValueError:
+        return None
+    path = storage.path(stored)
+    if not os.path.isfile(path):
+        return None
+    sizes = {'identity': os.path.getsize(path)}
+    for encoding, suffix in (('gzip', '.gz'), ('br', '.br')):
+        if os.path.isfile(path + suffix):
+            sizes[encoding] = os.path.getsize(path + suffix)
+    return sizes
+
+
+def page_report(storage=None):
+    """
+    Returns, for every template, the bytes its local assets cost over the
+    wire without compression, with gzip, and with Brotli (falling back to
+    gzip for files without a `.br` variant), along with the references that
+    are missing from STATIC_ROOT or not versioned by the `static` tag.
+    """
+    report = OrderedDict()
+    for page, references in template_references().items():
+        row = OrderedDict([('assets', 0), ('identity', 0), ('gzip', 0), ('br', 0), ('missing', []),
+                           ('unversioned', [])])
+        for name, tag in references:
+            sizes = collected_sizes(name, storage)
+            if sizes is None:
+                row['missing'].append(name)
+                continue
+            if not tag:
+                row['unversioned'].append(name)
+            row['assets'] += 1
+            row['identity'] += sizes['identity']
+            row['gzip'] += sizes.get('gzip', sizes['identity'])
+            row['br'] += sizes.get('br', sizes.get('gzip', sizes['identity']))
+        report[page] = row
+    return report
@@ -0,0 +1,67 @@
+# coding=utf-8
+
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from applications.accounts.user_cache import get_cached_user
+from utils.tokens import ACCESS, InvalidToken, verify_token
+
+
+class SignedTokenUser(SimpleLazyObject):
+    """
+    User of a verified access token.
+
+    The id and role are answered from the token claims; any other attribute
+    loads the user once (through the user cache), so views can still read
+    and save `request.user` like a model instance.
+    """
+
+    def __init__(self, claims):
+        self.__dict__['claims'] = claims
+        super(SignedTokenUser, self).__init__(lambda: get_cached_user(claims['u']))
+
+    @property
+    def pk(self):
+        return self.claims['u'] if self._wrapped is empty else self._wrapped.pk
+
+    id = pk
+
+    @property
+    def role(self):
+        return self.claims['r'] if self._wrapped is empty else self._wrapped.role
+
+    @property
+    def is_active(self):
+        # Tokens are only issued to active users, deactivation takes effect when the access token expires.
+        return True if self._wrapped is empty else self._wrapped.is_active
+
+    def is_authenticated(self):
+        return True
+
+    def is_anonymous(self):
+        return False
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates `Authorization: Bearer <access token>` requests from the
+    token signature alone, without the session table or a user query.
+    """
+
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        try:
+            claims = verify_token(auth[1], ACCESS)
+        except InvalidToken as e:
+            raise AuthenticationFailed(str(e))
+        return (SignedTokenUser(claims), claims)
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
@@ -0,0 +1,55 @@
+# coding=utf-8
+
+import hashlib
+import math
+import struct
+
+
+class BloomFilter(object):
+    """
+    Fixed size Bloom filter of strings.
+
+    `value in bloom` is False only for values never added; it may be True for
+    values never added with a probability close to `error_rate` as long as
+    no more than `capacity` values were added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        num_bits = -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.num_bits = max(int(math.ceil(num_bits)), 8)
+        self.num_hashes = max(int(round(self.num_bits / float(self.capacity) * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions derived from two 64 bit halves of one digest.
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(value.encode('utf-8')).digest())
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        """ Adds a value, returns False when it was (probably) present already. """
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def fill_ratio(self):
+        return sum(bin(byte).count('1') for byte in self.bits) / float(self.num_bits)
+
+    def estimated_false_positive_rate(self):
+        """ False positive rate implied by the current share of set bits. """
+        return self.fill_ratio() ** self.num_hashes
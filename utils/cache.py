@@ -0,0 +1,100 @@
+# coding=utf-8
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from utils.metrics import cache_lookups
+
+
+class LRUCache(object):
+    """
+    Bounded, thread safe in-process LRU cache.
+    Entries expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return default
+            # Re-inserting moves the key to the most recently used end.
+            self._data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache(object):
+    """
+    In-process `LRUCache` in front of a Django cache backend.
+
+    Local hits cost no network round trip; local misses fall back to the
+    shared backend so other workers benefit from a value fetched once.
+    """
+
+    def __init__(self, prefix, maxsize=1024, ttl=300, shared=True, alias='default'):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared = caches[alias] if shared else None
+
+    def _shared_key(self, key):
+        return '%s:%s' % (self.prefix, key)
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            cache_lookups.labels(self.prefix, 'local').inc()
+            return value
+        if self.shared is not None:
+            value = self.shared.get(self._shared_key(key))
+            if value is not None:
+                self.local.set(key, value)
+        cache_lookups.labels(self.prefix, 'miss' if value is None else 'shared').inc()
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl=ttl)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+
+def hash_key(value):
+    """ Returns a stable digest so secrets (e.g. access tokens) are never used as cache keys. """
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
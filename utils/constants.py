@@ -11,5 +11,5 @@ USER_ROLES = (
         (BECO_ASSOCIATE, 'Associate'),
     )
 
-FB_GRAPH_API_PROFILE_URL = 'https://graph.facebook.com/me'
+FB_GRAPH_API_URL = 'https://graph.facebook.com'
 PROFILE_IMAGE_DIR = 'ProfileImage'
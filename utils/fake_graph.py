@@ -0,0 +1,235 @@
+# coding=utf-8
+
+"""
+Stand-in for the Facebook Graph API, used for offline load tests.
+
+Serves `/me`, `/<page_id>/feed` and batch requests for seeded fixture
+users, with configurable latency, error rate and rate limiting. Point the
+app at it with the `FB_GRAPH_API_URL` setting.
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.utils.six.moves import socketserver
+from django.utils.six.moves.urllib.parse import parse_qs
+
+FIXTURE_TOKEN_PREFIX = 'fake-token-'
+FIXTURE_UID_BASE = 100000000000000
+
+STATUS_LINES = {
+    200: '200 OK',
+    400: '400 Bad Request',
+    404: '404 Not Found',
+    500: '500 Internal Server Error',
+}
+
+
+def fixture_user(n):
+    """ Returns the Graph `/me` payload of fixture user `n`, whose access token is `fake-token-<n>`. """
+    return {
+        'id': str(FIXTURE_UID_BASE + n),
+        'name': 'Fake User%d' % n,
+        'first_name': 'Fake',
+        'last_name': 'User%d' % n,
+        'email': 'fake.user%d@example.com' % n,
+        'verified': True,
+        'locale': 'en_US',
+        'timezone': 0,
+        'gender': 'female' if n % 2 else 'male',
+        'link': 'https://www.facebook.com/app_scoped_user_id/%d/' % (FIXTURE_UID_BASE + n),
+        'updated_time': '2017-12-14T06:06:00+0000',
+    }
+
+
+def fixture_token(n):
+    return '%s%d' % (FIXTURE_TOKEN_PREFIX, n)
+
+
+def parse_latency(spec):
+    """
+    Parses a latency distribution spec into a function returning seconds.
+
+    Supported specs (values in milliseconds): `fixed:50`, `uniform:20,80`,
+    `normal:60,15` and `lognormal:4,0.5` (mu and sigma of the log of the latency).
+    """
+    if not spec:
+        return lambda rnd: 0.0
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda rnd: values[0] / 1000.0
+    if kind == 'uniform':
+        return lambda rnd: rnd.uniform(values[0], values[1]) / 1000.0
+    if kind == 'normal':
+        return lambda rnd: max(rnd.normalvariate(values[0], values[1]), 0.0) / 1000.0
+    if kind == 'lognormal':
+        return lambda rnd: rnd.lognormvariate(values[0], values[1]) / 1000.0
+    raise ValueError('Unknown latency distribution: %s' % spec)
+
+
+def graph_error(message, code, error_type='OAuthException', transient=False):
+    return {'error': {'message': message, 'type': error_type, 'code': code, 'is_transient': transient}}
+
+
+class FakeGraphAPI(object):
+    """
+    WSGI application emulating the Graph endpoints used by this project.
+
+    `users` maps access tokens to `/me` payloads, tokens of the form
+    `fake-token-<n>` with `n < fixture_users` are answered without being stored.
+    """
+
+    def __init__(self, users=None, fixture_users=100000, latency=None, error_rate=0.0,
+                 rate_limit=0, rate_window=60, seed=None):
+        self.users = dict(users or {})
+        self.fixture_users = fixture_users
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._post_ids = itertools.count(1)
+        self._window_start = time.time()
+        self._window_calls = 0
+        self.calls = {}
+
+    def user_for_token(self, token):
+        if token in self.users:
+            return self.users[token]
+        if token and token.startswith(FIXTURE_TOKEN_PREFIX):
+            n = token[len(FIXTURE_TOKEN_PREFIX):]
+            if n.isdigit() and int(n) < self.fixture_users:
+                return fixture_user(int(n))
+        return None
+
+    def _count_call(self, endpoint):
+        """ Counts a call and returns the share of the rate limit used, in percent. """
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_calls = now, 0
+            self._window_calls += 1
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            if not self.rate_limit:
+                return 0
+            return int(self._window_calls * 100 / self.rate_limit)
+
+    def handle(self, method, path, params):
+        """ Routes a single Graph call and returns a `(status, payload)` pair. """
+        parts = [part for part in path.split('/') if part]
+        if parts and parts[0].startswith('v') and '.' in parts[0]:
+            parts = parts[1:]
+        token = params.get('access_token')
+
+        if parts == ['me'] and method == 'GET':
+            user = self.user_for_token(token)
+            if user is None:
+                return 400, graph_error('Invalid OAuth access token.', 190)
+            fields = params.get('fields')
+            if fields:
+                user = dict((key, value) for key, value in user.items() if key in fields.split(','))
+            return 200, user
+        if len(parts) == 2 and parts[1] == 'feed' and method == 'POST':
+            if not params.get('message'):
+                return 400, graph_error('(#100) Missing message or attachment.', 100)
+            return 200, {'id': '%s_%d' % (parts[0], next(self._post_ids))}
+        return 404, graph_error('Unknown path components: /%s' % '/'.join(parts), 2500)
+
+    def handle_batch(self, params):
+        try:
+            batch = json.loads(params.get('batch') or '')
+        except ValueError:
+            return 400, graph_error('(#100) The parameter batch must be a JSON array.', 100)
+        responses = []
+        for item in batch[:50]:
+            path, _, query = item.get('relative_url', '').partition('?')
+            item_params = dict((key, values[0]) for key, values in parse_qs(query).items())
+            item_params.update((key, values[0]) for key, values in parse_qs(item.get('body', '')).items())
+            item_params.setdefault('access_token', params.get('access_token'))
+            status, payload = self.handle(item.get('method', 'GET').upper(), path, item_params)
+            responses.append({'code': status, 'headers': [{'name': 'Content-Type', 'value': 'application/json'}],
+                              'body': json.dumps(payload)})
+        return 200, responses
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '/')
+        params = dict((key, values[0]) for key, values in parse_qs(environ.get('QUERY_STRING', '')).items())
+        if method == 'POST':
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(length).decode('utf-8') if length else ''
+            params.update((key, values[0]) for key, values in parse_qs(body).items())
+
+        is_batch = method == 'POST' and path.strip('/') == '' and 'batch' in params
+        usage = self._count_call('batch' if is_batch else path)
+        time.sleep(self.latency(self.random))
+
+        if self.rate_limit and usage > 100:
+            status, payload = 400, graph_error('(#4) Application request limit reached', 4, transient=True)
+        elif self.error_rate and self.random.random() < self.error_rate:
+            status, payload = 500, graph_error('An unexpected error has occurred. Please retry your request later.',
+                                               2, transient=True)
+        elif is_batch:
+            status, payload = self.handle_batch(params)
+        else:
+            status, payload = self.handle(method, path, params)
+
+        body = json.dumps(payload).encode('utf-8')
+        start_response(STATUS_LINES.get(status, '%d Error' % status), [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('X-App-Usage', json.dumps({'call_count': usage, 'total_time': usage, 'total_cputime': usage})),
+        ])
+        return [body]
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGraphServer(object):
+    """
+    Runs a `FakeGraphAPI` on a background thread, usable as a context manager:
+
+        with FakeGraphServer(FakeGraphAPI(latency='uniform:20,80')) as server:
+            settings.FB_GRAPH_API_URL = server.url
+    """
+
+    def __init__(self, app=None, host='127.0.0.1', port=0, quiet=True):
+        self.app = app or FakeGraphAPI()
+        self.server = make_server(host, port, self.app, server_class=ThreadingWSGIServer,
+                                  handler_class=QuietRequestHandler if quiet else WSGIRequestHandler)
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
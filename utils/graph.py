@@ -0,0 +1,147 @@
+# coding=utf-8
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from utils import instrumentation, metrics
+from utils.constants import FB_GRAPH_API_URL
+
+
+GRAPH_API_URL = getattr(settings, 'FB_GRAPH_API_URL', FB_GRAPH_API_URL)
+GRAPH_POOL_SIZE = getattr(settings, 'FB_GRAPH_POOL_SIZE', 10)
+GRAPH_CONNECT_TIMEOUT = getattr(settings, 'FB_GRAPH_CONNECT_TIMEOUT', 3.05)
+GRAPH_READ_TIMEOUT = getattr(settings, 'FB_GRAPH_READ_TIMEOUT', 10)
+GRAPH_MAX_RETRIES = getattr(settings, 'FB_GRAPH_MAX_RETRIES', 2)
+GRAPH_RETRY_BACKOFF = getattr(settings, 'FB_GRAPH_RETRY_BACKOFF', 0.2)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class GraphEndpointStats(object):
+    """
+    Thread safe per-endpoint call counters and latencies (in milliseconds).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, elapsed, error=False, retries=0):
+        elapsed_ms = elapsed * 1000.0
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = {
+                    'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0
+                }
+            stats['calls'] += 1
+            stats['errors'] += 1 if error else 0
+            stats['retries'] += retries
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return dict((endpoint, dict(stats)) for endpoint, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class GraphClient(object):
+    """
+    Facebook Graph API client.
+
+    Keeps a pooled keep-alive `requests.Session`, applies connect/read
+    timeouts to every call and retries transient failures with a jittered
+    exponential backoff. Unsafe methods (POST) are only retried when the
+    connection could not be established, so a post is never sent twice.
+    """
+
+    def __init__(self, base_url=GRAPH_API_URL, pool_size=GRAPH_POOL_SIZE,
+                 connect_timeout=GRAPH_CONNECT_TIMEOUT, read_timeout=GRAPH_READ_TIMEOUT,
+                 max_retries=GRAPH_MAX_RETRIES, backoff=GRAPH_RETRY_BACKOFF):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = GraphEndpointStats()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, path):
+        return '%s/%s' % (self.base_url, path.lstrip('/'))
+
+    def _sleep(self, attempt):
+        # Full jitter keeps retrying workers from hitting Graph in lockstep.
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def request(self, method, path, endpoint=None, timeout=None, **kwargs):
+        """
+        Performs a Graph API call and returns the `requests.Response`.
+        Raises the last `requests.RequestException` once retries are exhausted.
+        """
+        endpoint = endpoint or path
+        safe = method.upper() in ('GET', 'HEAD')
+        url = self.url(path)
+        attempt = 0
+        start = time.time()
+
+        while True:
+            try:
+                resp = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException as e:
+                retryable = safe or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or attempt >= self.max_retries:
+                    self.stats.record(endpoint, time.time() - start, error=True, retries=attempt)
+                    instrumentation.record('graph', time.time() - start)
+                    metrics.graph_request_duration.labels(endpoint, 'error').observe(time.time() - start)
+                    raise
+            else:
+                if not (safe and resp.status_code in RETRY_STATUS_CODES) or attempt >= self.max_retries:
+                    self.stats.record(endpoint, time.time() - start, error=resp.status_code >= 400, retries=attempt)
+                    instrumentation.record('graph', time.time() - start)
+                    metrics.graph_request_duration.labels(endpoint, 'error' if resp.status_code >= 400 else 'ok') \
+                        .observe(time.time() - start)
+                    return resp
+            self._sleep(attempt)
+            attempt += 1
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params=params, **kwargs)
+
+    def post(self, path, params=None, data=None, **kwargs):
+        return self.request('POST', path, params=params, data=data, **kwargs)
+
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client():
+    """
+    Returns the Graph client of the current process.
+    A forked worker gets its own client so pooled sockets are never shared, and
+    a changed `FB_GRAPH_API_URL` setting (e.g. a fake Graph server) takes effect.
+    """
+    global _client, _client_key
+
+    key = (os.getpid(), getattr(settings, 'FB_GRAPH_API_URL', FB_GRAPH_API_URL))
+    if _client is None or _client_key != key:
+        with _client_lock:
+            if _client is None or _client_key != key:
+                _client = GraphClient(base_url=key[1])
+                _client_key = key
+    return _client
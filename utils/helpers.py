@@ -3,13 +3,14 @@
 import re
 import time
 import string
-import requests
 from random import Random
 
 from django.conf import settings
+from django.utils.http import parse_etags, quote_etag
 
 from rest_framework import status
-from utils.constants import FB_GRAPH_API_PROFILE_URL, PROFILE_IMAGE_DIR
+from utils.constants import PROFILE_IMAGE_DIR
+from utils.graph import get_graph_client
 
 
 USING_AWS_S3 = getattr(settings, 'USE_AWS_S3', False)
@@ -21,18 +22,25 @@ class UtlRandom:
     '''
     random = ""
 
-    def __init__(self):
-        self.random = Random(x=time.time())
+    def __init__(self, seed=None):
+        self.random = Random(x=time.time() if seed is None else seed)
+
+    def random_chars(self, n, alphabet):
+        # Indexing with random() is several times faster than one choice() call per character.
+        rnd, size = self.random.random, len(alphabet)
+        return ''.join([alphabet[int(rnd() * size)] for _ in range(n)])
 
     def random_str(self, n):
-        return ''.join(self.random.choice(string.ascii_uppercase +
-                                          string.digits) for _ in range(n))
+        return self.random_chars(n, string.ascii_uppercase + string.digits)
 
     def random_num(self, b, e):
         return self.random.randint(b, e)
 
+    def random_digits(self, n):
+        return self.random_chars(n, string.digits)
+
     def random_username(self, length):
-        return ''.join(self.random.choice(string.lowercase) for i in range(length))
+        return self.random_chars(length, string.ascii_lowercase)
 
     def random_email(self, length):
         email_host = 'example.com'
@@ -61,14 +69,31 @@ class ValidateFBAccessToken(object):
 
     def is_valid(self):
         result = False
-        url = FB_GRAPH_API_PROFILE_URL + '?access_token=' + self.access_token
-        r = requests.get(url)
+        r = get_graph_client().get('me', params={'access_token': self.access_token}, endpoint='me')
         response = r.json()
         for key in self.data_to_validate.keys():
             result = True if self.data_to_validate[key] == response.get(key, None) else False
         return result
 
 
+def normalize_email(email):
+    """ Returns the case-insensitive form of an email used for lookups and uniqueness. """
+    return (email or '').strip().lower()
+
+
+def etag_matches(request, etag):
+    """
+    Returns True when the If-None-Match header of `request` matches the quoted `etag`.
+    If-None-Match uses the weak comparison, so a W/ prefix is ignored.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in [quote_etag(value) for value in parse_etags(header)]
+
+
 IDENTIFIER_REGEX = re.compile('^[\w\d_]+\.[\w\d_]+\.\d+$')
 
 
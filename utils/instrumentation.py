@@ -0,0 +1,143 @@
+# coding=utf-8
+
+"""
+Sampled per-request instrumentation.
+
+`InstrumentationMiddleware` traces a share of requests (`INSTRUMENTATION_SAMPLE_RATE`)
+and reports SQL, Graph, serializer and password hashing time in a
+`Server-Timing` header and a JSON log line on the `instrumentation` logger.
+Code reports to the trace of the current request with `timed(name)` or
+`record(name, seconds)`, both do nothing for requests not sampled.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.db import connections
+
+INSTRUMENTATION_SAMPLE_RATE = getattr(settings, 'INSTRUMENTATION_SAMPLE_RATE', 0.0)
+# Lets clients force a trace with an `X-Trace: 1` header.
+INSTRUMENTATION_TRACE_HEADER = getattr(settings, 'INSTRUMENTATION_TRACE_HEADER', False)
+
+logger = logging.getLogger('instrumentation')
+
+_local = threading.local()
+
+
+class RequestTrace(object):
+
+    def __init__(self):
+        self.started = time.time()
+        # `{name: [count, seconds]}`, other names recorded with `record` or `timed` follow these.
+        self.timings = OrderedDict([('sql', [0, 0.0]), ('graph', [0, 0.0]), ('serializer', [0, 0.0]),
+                                    ('hash', [0, 0.0])])
+        self._sql_marks = {}
+
+    def record(self, name, seconds, count=1):
+        timing = self.timings.setdefault(name, [0, 0.0])
+        timing[0] += count
+        timing[1] += seconds
+
+    def start_sql(self):
+        # Django 1.9 has no execute wrappers: queries of a traced request go through the debug cursor,
+        # which logs the duration of every query in `queries_log`.
+        for connection in connections.all():
+            if not connection.queries_logged:
+                connection.queries_log.clear()
+            self._sql_marks[connection.alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+
+    def stop_sql(self):
+        for connection in connections.all():
+            if connection.alias not in self._sql_marks:
+                continue
+            force_debug_cursor, mark = self._sql_marks.pop(connection.alias)
+            queries = list(connection.queries_log)[mark:]
+            connection.force_debug_cursor = force_debug_cursor
+            self.record('sql', sum(float(query['time']) for query in queries), count=len(queries))
+
+    def total(self):
+        return time.time() - self.started
+
+    def server_timing(self):
+        metrics = ['%s;desc="%d";dur=%.2f' % (name, count, seconds * 1000)
+                   for name, (count, seconds) in self.timings.items()]
+        return ', '.join(metrics + ['total;dur=%.2f' % (self.total() * 1000)])
+
+    def as_dict(self):
+        data = OrderedDict()
+        for name, (count, seconds) in self.timings.items():
+            data['%s_count' % name] = count
+            data['%s_ms' % name] = round(seconds * 1000, 2)
+        data['total_ms'] = round(self.total() * 1000, 2)
+        return data
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def record(name, seconds, count=1):
+    trace = current_trace()
+    if trace is not None:
+        trace.record(name, seconds, count)
+
+
+@contextmanager
+def timed(name):
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        trace.record(name, time.time() - started)
+
+
+class InstrumentationMiddleware(object):
+    """
+    Traces sampled requests. Must come first in `MIDDLEWARE_CLASSES` so the
+    trace covers every other middleware.
+    """
+
+    def process_request(self, request):
+        _local.trace = None
+        sampled = random.random() < INSTRUMENTATION_SAMPLE_RATE or \
+            (INSTRUMENTATION_TRACE_HEADER and request.META.get('HTTP_X_TRACE') == '1')
+        if sampled:
+            _local.trace = RequestTrace()
+            _local.trace.start_sql()
+
+    def process_response(self, request, response):
+        trace, _local.trace = current_trace(), None
+        if trace is None:
+            return response
+        trace.stop_sql()
+        response['Server-Timing'] = trace.server_timing()
+
+        match = getattr(request, 'resolver_match', None)
+        line = OrderedDict([('method', request.method), ('path', request.path),
+                            ('view', match.view_name if match else None), ('status', response.status_code)])
+        line.update(trace.as_dict())
+        logger.info(json.dumps(line))
+        return response
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    The default PBKDF2 hasher, recording every hash in the request trace.
+    It keeps the `pbkdf2_sha256` algorithm name, so stored hashes are unchanged.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        with timed('hash'):
+            return super(TimedPBKDF2PasswordHasher, self).encode(password, salt, iterations)
@@ -0,0 +1,327 @@
+# coding=utf-8
+
+"""
+Prometheus metrics shared by every worker process.
+
+Counters and fixed-bucket histograms record into a per-process store. With
+`METRICS_DIR` set, each process owns an append-only file of
+`(key, float64)` entries in that directory, mapped in memory. Recording is
+one unlocked in-place add (a lock is only taken to append a new series)
+and `/metrics` sums the files of every process, including exited ones, so
+counters never go backwards when a worker is replaced. Empty the directory
+before the workers start.
+
+Without `METRICS_DIR` values stay in process memory and `/metrics`
+reports the serving process only.
+
+`/metrics` answers scrapes sending `METRICS_AUTH_TOKEN` or coming from
+`METRICS_ALLOWED_IPS`, and is a 404 for everyone when neither is set.
+"""
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', None)
+# When set, scrapes must send `Authorization: Bearer <METRICS_AUTH_TOKEN>`.
+METRICS_AUTH_TOKEN = getattr(settings, 'METRICS_AUTH_TOKEN', None)
+# `REMOTE_ADDR`s allowed to scrape without the token, only reliable when the app is not behind a proxy.
+METRICS_ALLOWED_IPS = tuple(getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HEADER = struct.Struct('<I4x')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+INITIAL_FILE_SIZE = 1 << 16
+
+
+def _align(position):
+    return (position + 7) & ~7
+
+
+def read_entries(data):
+    """ Yields the `(key, value)` entries of a store file's content. """
+    if len(data) < HEADER.size:
+        return
+    used = HEADER.unpack_from(data, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key = data[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length].decode('utf-8')
+        value_position = _align(position + KEY_LENGTH.size + length)
+        yield key, VALUE.unpack_from(data, value_position)[0]
+        position = value_position + VALUE.size
+
+
+class MmapStore(object):
+    """
+    Values of one process in a memory-mapped file. Entries are only ever
+    appended, and the used size in the header is written after the entry,
+    so concurrent readers never see a partial entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # Already created, by another worker possibly.
+            pass
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_FILE_SIZE:
+            os.ftruncate(self._file.fileno(), INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        # Superseded maps stay open: a thread may still be adding through one, and they share the file's pages.
+        self._old_maps = []
+        self._used = HEADER.unpack_from(self._map, 0)[0] or HEADER.size
+        self._positions = {}
+        position = HEADER.size
+        for key, value in read_entries(self._map[:self._used]):
+            length = len(key.encode('utf-8'))
+            self._positions[key] = _align(position + KEY_LENGTH.size + length)
+            position = self._positions[key] + VALUE.size
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        os.ftruncate(self._file.fileno(), capacity)
+        self._old_maps.append(self._map)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self._capacity = capacity
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        value_position = _align(self._used + KEY_LENGTH.size + len(encoded))
+        if value_position + VALUE.size > self._capacity:
+            self._grow(value_position + VALUE.size)
+        KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + KEY_LENGTH.size:self._used + KEY_LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self._map, value_position, 0.0)
+        self._used = value_position + VALUE.size
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = value_position
+        return value_position
+
+    def inc(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            with self._lock:
+                position = self._positions.get(key)
+                if position is None:
+                    position = self._append(key)
+        data = self._map
+        # Not atomic: threads of one process may rarely lose an increment, processes never share a file.
+        VALUE.pack_into(data, position, VALUE.unpack_from(data, position)[0] + amount)
+
+    def items(self):
+        return read_entries(self._map[:self._used])
+
+
+class MemoryStore(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] += amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """ Returns the store of the current process, a forked worker gets its own file. """
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                _store = MmapStore(os.path.join(METRICS_DIR, 'metrics-%d.db' % pid)) if METRICS_DIR \
+                    else MemoryStore()
+                _store_pid = pid
+    return _store
+
+
+def collect():
+    """ Returns the `{key: value}` sums over every process. """
+    if not METRICS_DIR:
+        return dict(get_store().items())
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.db')):
+        with open(path, 'rb') as store_file:
+            for key, value in read_entries(store_file.read()):
+                totals[key] += value
+    return totals
+
+
+REGISTRY = {}
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        REGISTRY[name] = self
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self.child_class(self, values))
+        return child
+
+    def key(self, suffix, values, extra=()):
+        return json.dumps([self.name, suffix, [[name, '%s' % value] for name, value
+                                               in zip(self.labelnames, values)] + list(extra)])
+
+
+class CounterChild(object):
+
+    def __init__(self, metric, values):
+        self._key = metric.key('', values)
+
+    def inc(self, amount=1):
+        get_store().inc(self._key, amount)
+
+
+class Counter(Metric):
+    """ Monotonic counter, names end with `_total`. """
+    kind = 'counter'
+    child_class = CounterChild
+
+
+class HistogramChild(object):
+
+    def __init__(self, metric, values):
+        self._bounds = metric.buckets
+        self._bucket_keys = [metric.key('_bucket', values, [['le', bound]]) for bound in metric.bucket_labels]
+        self._sum_key = metric.key('_sum', values)
+
+    def observe(self, value):
+        store = get_store()
+        store.inc(self._bucket_keys[bisect.bisect_left(self._bounds, value)], 1)
+        store.inc(self._sum_key, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    child_class = HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_labels = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{%s}' % ','.join('%s="%s"' % (label, _escape(label_value)) for label, label_value in labels)
+    return '%s %r' % (name, float(value))
+
+
+def render():
+    """ Returns every metric in the Prometheus text exposition format 0.0.4. """
+    samples = defaultdict(list)
+    for key, value in collect().items():
+        name, suffix, labels = json.loads(key)
+        samples[name].append((suffix, labels, value))
+
+    lines = []
+    for name in sorted(samples):
+        metric = REGISTRY.get(name)
+        if metric is None:
+            continue
+        lines.append('# HELP %s %s' % (name, metric.documentation))
+        lines.append('# TYPE %s %s' % (name, metric.kind))
+        if metric.kind == 'counter':
+            for suffix, labels, value in sorted(samples[name]):
+                lines.append(_sample(name + suffix, labels, value))
+            continue
+
+        # Buckets are stored per bucket, the exposition format wants them cumulative plus a count.
+        series = defaultdict(lambda: {'buckets': defaultdict(float), 'sum': 0.0})
+        for suffix, labels, value in samples[name]:
+            if suffix == '_bucket':
+                series[tuple(map(tuple, labels[:-1]))]['buckets'][labels[-1][1]] += value
+            else:
+                series[tuple(map(tuple, labels))]['sum'] += value
+        for labels in sorted(series):
+            cumulative = 0.0
+            for bound in metric.bucket_labels:
+                cumulative += series[labels]['buckets'].get(bound, 0.0)
+                lines.append(_sample(name + '_bucket', list(labels) + [('le', bound)], cumulative))
+            lines.append(_sample(name + '_count', list(labels), cumulative))
+            lines.append(_sample(name + '_sum', list(labels), series[labels]['sum']))
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(request):
+    if METRICS_AUTH_TOKEN and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''),
+                                                    'Bearer %s' % METRICS_AUTH_TOKEN):
+        return True
+    return request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        if not METRICS_AUTH_TOKEN and not METRICS_ALLOWED_IPS:
+            raise Http404
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+http_requests = Counter('http_requests_total', 'HTTP requests by view, method and status code.',
+                        ('view', 'method', 'status'))
+http_request_duration = Histogram('http_request_duration_seconds', 'HTTP request latency by view.', ('view',))
+graph_request_duration = Histogram('graph_request_duration_seconds', 'Graph API call latency by endpoint.',
+                                   ('endpoint', 'outcome'))
+cache_lookups = Counter('cache_lookups_total', 'Two-tier cache lookups by cache and result (local, shared, miss).',
+                        ('cache', 'result'))
+
+
+class MetricsMiddleware(object):
+    """ Records the latency and status of every request by view class (or function) name. """
+
+    def process_request(self, request):
+        request._metrics_started = time.time()
+
+    def process_response(self, request, response):
+        started = getattr(request, '_metrics_started', None)
+        if started is None:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        view = getattr(match.func, '__name__', 'unknown') if match else 'unmatched'
+        http_request_duration.labels(view).observe(time.time() - started)
+        http_requests.labels(view, request.method, response.status_code).inc()
+        return response
@@ -0,0 +1,36 @@
+# coding=utf-8
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+
+# Below this many rows the planner estimate is not trusted, the table is counted exactly.
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 100000)
+
+
+def estimated_count(queryset, threshold=ESTIMATED_COUNT_THRESHOLD):
+    """
+    Returns the row count of a queryset. Unfiltered querysets of large tables
+    on PostgreSQL are counted from the planner statistics instead of a full
+    `COUNT(*)` scan; the result is then approximate.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+    if connection.vendor == 'postgresql' and not query.where and not query.distinct \
+            and query.low_mark == 0 and query.high_mark is None:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= threshold:
+            return int(row[0])
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """ Paginator counting its object list with `estimated_count`. """
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimated_count(self.object_list)
+        return self._count
+    count = property(_get_count)
@@ -0,0 +1,91 @@
+# coding=utf-8
+
+"""
+Bounded password hashing.
+
+`make_passwords` hashes batches inline, or on a per-process
+`multiprocessing` pool in processes opting in with `PASSWORD_HASH_WORKERS`
+(every gunicorn worker owning a pool would multiply the processes).
+`hashing_slot` optionally bounds how many logins hash at the same time
+across every worker sharing the default cache.
+"""
+
+import multiprocessing
+import os
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+
+# Pool processes hashing `make_passwords` batches, 0 hashes inline.
+PASSWORD_HASH_WORKERS = getattr(settings, 'PASSWORD_HASH_WORKERS', 0)
+# Smaller batches are hashed inline, dispatching them to the pool costs more than it saves.
+PASSWORD_HASH_POOL_MIN_BATCH = getattr(settings, 'PASSWORD_HASH_POOL_MIN_BATCH', 8)
+
+# Concurrent login hashes allowed across workers, None disables the bound.
+PASSWORD_HASH_CONCURRENCY = getattr(settings, 'PASSWORD_HASH_CONCURRENCY', None)
+PASSWORD_HASH_RETRY_AFTER = getattr(settings, 'PASSWORD_HASH_RETRY_AFTER', 1)
+
+HASH_SLOT_KEY = 'password-hash-slot:%d'
+# A slot leaked by a killed worker is given back when its key expires, far beyond any hash duration.
+HASH_SLOT_TIMEOUT = 60
+
+_pool_lock = threading.Lock()
+_pools = {}
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def get_hash_pool(workers):
+    """ Returns the hashing pool of the current process, created at first use so it is never forked. """
+    key = (os.getpid(), workers)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = multiprocessing.Pool(workers)
+    return pool
+
+
+def make_passwords(passwords, workers=None):
+    """
+    Returns `make_password(password)` of every password, in order, hashed on
+    a pool of `workers` processes (default `PASSWORD_HASH_WORKERS`) when above 1.
+    """
+    passwords = list(passwords)
+    workers = PASSWORD_HASH_WORKERS if workers is None else workers
+    if len(passwords) < PASSWORD_HASH_POOL_MIN_BATCH or workers <= 1:
+        return [make_password(password) for password in passwords]
+    chunksize = max(len(passwords) // (workers * 4), 1)
+    return get_hash_pool(workers).map(make_password, passwords, chunksize)
+
+
+def _take_slot():
+    """ Returns the key of a free slot, now held, or None. Each slot is its own key with its own expiry. """
+    start = random.randrange(PASSWORD_HASH_CONCURRENCY)
+    for offset in range(PASSWORD_HASH_CONCURRENCY):
+        key = HASH_SLOT_KEY % ((start + offset) % PASSWORD_HASH_CONCURRENCY)
+        if cache.add(key, 1, HASH_SLOT_TIMEOUT):
+            return key
+    return None
+
+
+@contextmanager
+def hashing_slot():
+    """ Holds one of the `PASSWORD_HASH_CONCURRENCY` hashing slots, raises `HashingBusy` when none is free. """
+    if not PASSWORD_HASH_CONCURRENCY:
+        yield
+        return
+    key = _take_slot()
+    if key is None:
+        raise HashingBusy()
+    try:
+        yield
+    finally:
+        cache.delete(key)
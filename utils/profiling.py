@@ -0,0 +1,95 @@
+# coding=utf-8
+
+"""
+Production request profiling.
+
+`ProfilingMiddleware` runs a sampled share of views (`PROFILING_SAMPLE_RATE`),
+and views of requests sending `X-Profile: <PROFILING_TOKEN>`, under
+cProfile. Each profile is written to `<PROFILING_DIR>/<view name>/`, which
+keeps the newest `PROFILING_MAX_FILES` profiles of the view;
+`manage.py profile_report` ranks their hottest functions.
+"""
+
+import cProfile
+import os
+import random
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+PROFILING_SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+# Requests are only profiled on demand when a token is configured.
+PROFILING_TOKEN = getattr(settings, 'PROFILING_TOKEN', None)
+PROFILING_DIR = getattr(settings, 'PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'facebook-profiles'))
+PROFILING_MAX_FILES = getattr(settings, 'PROFILING_MAX_FILES', 50)
+
+PROFILE_SUFFIX = '.prof'
+
+
+def view_name(view_func):
+    name = getattr(view_func, '__name__', None) or view_func.__class__.__name__
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def profile_paths(directory):
+    """ Returns the profile files of a view directory, oldest first. """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX))
+
+
+def save_profile(profiler, name):
+    directory = os.path.join(PROFILING_DIR, name)
+    try:
+        os.makedirs(directory)
+    except OSError:
+        pass
+    # Names sort by time, so rotation drops the oldest profiles.
+    profiler.dump_stats(os.path.join(directory, '%.6f-%d%s' % (time.time(), os.getpid(), PROFILE_SUFFIX)))
+    for path in profile_paths(directory)[:-PROFILING_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Rotated by another worker already.
+            pass
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles the view and the rendering of its response. The profiler starts
+    in `process_view` without calling the view itself, so Django still runs
+    the view with the `process_view`, `process_exception` and
+    `ATOMIC_REQUESTS` handling of a normal request, and stops in
+    `process_response` (after a template response is rendered) or in
+    `process_exception`. Must come last in `MIDDLEWARE_CLASSES`, so the
+    profile covers little besides the view.
+    """
+
+    def should_profile(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token and PROFILING_TOKEN and constant_time_compare(token, PROFILING_TOKEN):
+            return True
+        return random.random() < PROFILING_SAMPLE_RATE
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.should_profile(request):
+            profiler = cProfile.Profile()
+            request._profiler = (profiler, view_name(view_func))
+            profiler.enable()
+        return None
+
+    def finish(self, request):
+        profiler, name = getattr(request, '_profiler', (None, None))
+        if profiler is not None:
+            del request._profiler
+            profiler.disable()
+            save_profile(profiler, name)
+
+    def process_exception(self, request, exception):
+        self.finish(request)
+        return None
+
+    def process_response(self, request, response):
+        self.finish(request)
+        return response